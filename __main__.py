@@ -1,6 +1,20 @@
 #!/bin/env python
 
 from atexit import register
+from collections import OrderedDict
+from os import write
+from os.path import join
+from sys import argv, stderr
+from threading import Thread
+from time import perf_counter
+
+started_at = perf_counter() # for --startup-time
+
+time_startup = argv[1:] == ["--startup-time"]
+
+if __name__ == "__main__" and len(argv) > 1 and not time_startup:
+  from tab_wrangler.cli import main # a command, so no interface needed
+  raise SystemExit(main())
 
 from urwid import (AttrMap,
                    Button,
@@ -12,6 +26,7 @@ from urwid import (AttrMap,
                    Frame,
                    LineBox,
                    ListBox,
+                   ListWalker,
                    MainLoop,
                    Overlay,
                    Pile,
@@ -26,10 +41,28 @@ from urllib.error import HTTPError
 from urwid.raw_display import Screen
 from urwid.signals import MetaSignals
 
-from tab_wrangler.browser \
-  import get_windows, close, save_and_close, focus_window
+from tab_wrangler.browser import (snapshot,
+                                  close,
+                                  close_duplicates,
+                                  save_and_close,
+                                  focus_window,
+                                  get_session,
+                                  index_tabs,
+                                  restore,
+                                  shutdown,
+                                  undo,
+                                  snapshot_path)
   # TODO focus_window should be imported from WM/DE module - not browser
+from tab_wrangler.archive \
+  import close_archive, folder, get_index, get_urls, read_tabs
+from tab_wrangler.domains import DomainIndex
+from tab_wrangler.duplicates import DuplicateIndex
+from tab_wrangler.instrumentation \
+  import close_trace, histogram_bounds, latencies, milliseconds, span
+from tab_wrangler.journal import close_journal
+from tab_wrangler.search import SearchIndex
 
+imported_at = perf_counter()
 
 class EditBox(Edit):
 
@@ -49,18 +82,158 @@ class EditBox(Edit):
 
     Edit.keypress(self, size, key)
 
+class TabListWalker(ListWalker):
+  """the tabs of one window, making widgets only for rows actually rendered
+
+  Widgets are kept in a least-recently-used cache keyed by tab,
+  so that moving back and forth between windows reuses them.
+  A tab open more than once, by copies (a function of its URL),
+  is marked with how many times.
+  """
+
+  def __init__(self, cache_size=4096, copies=None):
+
+    self._tabs = []
+
+    self._copies = copies
+
+    self._focus = 0
+
+    self._widgets = OrderedDict()
+
+    self._cache_size = cache_size
+
+  def __len__(self):
+    return len(self._tabs)
+
+  def set_tabs(self, tabs):
+
+    self._tabs = tabs
+
+    self._focus = 0
+
+    self._modified()
+
+  def clear(self):
+    self.set_tabs([])
+
+  def get_focus(self):
+
+    if not self._tabs:
+      return None, None
+
+    return self._widget(self._focus), self._focus
+
+  def set_focus(self, position):
+
+    self._focus = position
+
+    self._modified()
+
+  def get_next(self, position):
+
+    if position + 1 >= len(self._tabs):
+      return None, None
+
+    return self._widget(position + 1), position + 1
+
+  def get_prev(self, position):
+
+    if position <= 0:
+      return None, None
+
+    return self._widget(position - 1), position - 1
+
+  def positions(self, reverse=False):
+
+    if reverse:
+      return range(len(self._tabs) - 1, -1, -1)
+
+    return range(len(self._tabs))
+
+  def _widget(self, position):
+
+    tab = self._tabs[position]
+
+    copies = 1 if self._copies is None else self._copies(tab["url"])
+
+    key = (tab["id"], tab["title"], tab["url"], copies)
+
+    widget = self._widgets.get(key)
+
+    if widget is not None:
+      self._widgets.move_to_end(key)
+      return widget
+
+    # TODO different colors for title & url
+    widget = SelectableIcon((f"({copies}×) " if copies > 1 else '')
+                            + tab["title"] + f" [{tab['url']}]")
+
+    widget.set_layout(align="left", wrap="ellipsis")
+
+    self._widgets[key] = widget
+
+    if len(self._widgets) > self._cache_size:
+      self._widgets.popitem(last=False)
+
+    return widget
+
 class WindowListWalker(SimpleFocusListWalker):
 
   def __init__(self, *args, **kwargs):
 
+    self._window_ids = [] # of the rows, rebuilt lazily after any change
+
+    self._positions = {} # window id: row index, likewise
+
     super().__init__(contents=[], *args, **kwargs)
 
-    self.tab_list_walker = SimpleFocusListWalker(contents=[])
+    self.duplicate_index = DuplicateIndex()
 
-    self.window_count = Text(markup='')
+    self.tab_list_walker = TabListWalker(copies=self.duplicate_index.copies)
+
+    self.window_count = Text(markup=" loading…", wrap="ellipsis")
     self.tab_count = Text(markup='')
 
-    self.update_window_list()
+    self.refresh_indicator = Text(markup='')
+
+    self.windows = {}
+
+    self.tabs = {}
+
+    self.selected = set() # ids of checked windows, kept by _toggled
+
+    self.search_index = SearchIndex()
+
+    self.filter_query = None # narrowing the rows, if set
+
+    self._unfiltered = None # every row, while filtered
+
+    self.domain_index = DomainIndex() # brought up to date once grouping
+
+    self.by_site = False # rows of sites, across windows, instead of windows
+
+    self._window_rows = None # while by site
+
+    self._window_focus = None # likewise
+
+    self.stale = False # listing the last run's windows, whose tab ids
+                       # a restarted browser may have given to other tabs
+
+    self.on_reconciled = None # called after taking in a new snapshot
+
+    self._refresh_pipe = None
+
+    self._refresh_thread = None
+
+    self._refresh_pending = False
+
+    self._pending_max_age = None
+
+    self._fetched = None
+
+    if snapshot.windows is not None: # as saved by the last run
+      self._reconcile(snapshot.windows, stale=snapshot.stale)
 
     self._remember_relative_position()
 
@@ -74,48 +247,205 @@ class WindowListWalker(SimpleFocusListWalker):
 
   @property
   def window_ids(self):
-    return [window.id for window in self]
 
-  def update_window_list(self):
+    if self._window_ids is None:
+      self._window_ids = [window.id for window in self]
+      self._positions = {window_id: position for position, window_id
+                         in enumerate(self._window_ids)}
+
+    return self._window_ids
+
+  def position(self, window_id):
+    """index of the window's row, or None if not listed"""
+
+    self.window_ids # bring the index up to date
+
+    return self._positions.get(window_id)
+
+  def remove_windows(self, window_ids):
+    """removes the rows of the given windows, rebuilding the list just once,
+       and focusing the first remaining row after the focus as del would"""
+
+    window_ids = set(window_ids)
+
+    focus = self.focus
+
+    kept = []
+
+    for index, row in enumerate(self):
+
+      if index == focus:
+        focus = len(kept)
+
+      if row.id not in window_ids:
+        kept.append(row)
+
+    if len(kept) == len(self):
+      return
+
+    self.selected -= window_ids
+
+    if self._unfiltered is not None:
+      self._unfiltered = [row for row in self._unfiltered
+                          if row.id not in window_ids]
+
+    self[:] = kept
+
+    if kept:
+      self.set_focus(min(focus, len(kept) - 1))
+
+  def _toggled(self, window_id, checkbox, state):
+
+    if state:
+      self.selected.add(window_id)
+    else:
+      self.selected.discard(window_id)
+
+  def _validate_contents_modified(self, indices, new_items):
+    """called by MonitoredFocusList before any change to the rows"""
+
+    start, stop, step = indices
+
+    if (    self._window_ids is not None
+        and start == stop == len(self)): # appending: extend the index
+      for position, item in enumerate(new_items, start=len(self)):
+        self._window_ids.append(item.id)
+        self._positions[item.id] = position
+
+    else:
+      self._window_ids = None
+
+    return None # leave the focus to be adjusted as usual
+
+  def watch(self, main_loop):
+    """lets refresh() hand fetched snapshots back to the main loop"""
+
+    self._refresh_pipe = main_loop.watch_pipe(callback=self._refreshed)
+
+  def update_window_list(self, max_age=None):
+    """reconciles the list with the tab snapshot,
+       refetched only if older than max_age (default max_snapshot_age)"""
+
+    self._reconcile(snapshot.get(max_age=max_age))
+
+  def refresh(self, max_age=None):
+    """like update_window_list, but fetches in a background thread"""
+
+    if self._refresh_pipe is None:
+      self.update_window_list(max_age=max_age)
+      return
+
+    if self._refresh_thread is not None: # fetch again once this one lands
+
+      if not self._refresh_pending or self._pending_max_age is None:
+        self._pending_max_age = max_age
+      elif max_age is not None:
+        self._pending_max_age = min(self._pending_max_age, max_age)
+
+      self._refresh_pending = True
+
+      return
+
+    self.refresh_indicator.set_text(" refreshing…")
+
+    self._refresh_thread = Thread(target = self._fetch,
+                                  args   = (max_age,),
+                                  daemon = True)
+
+    self._refresh_thread.start()
+
+  def _fetch(self, max_age):
+    """runs in the refresh thread"""
+
+    try:
+      self._fetched = snapshot.get(max_age=max_age)
+    except Exception as error:
+      self._fetched = error
+
+    write(self._refresh_pipe, b'.')
+
+  def _refreshed(self, data):
+    """runs in the main loop once the refresh thread has fetched"""
+
+    self._refresh_thread.join()
+
+    self._refresh_thread = None
+
+    self.refresh_indicator.set_text('')
+
+    fetched, self._fetched = self._fetched, None
+
+    if self._refresh_pending: # e.g. asked for after closing tabs, so this
+      self._refresh_pending = False # snapshot may still list them
+      self.refresh(max_age=self._pending_max_age)
+      return
+
+    if isinstance(fetched, Exception):
+      raise fetched
+
+    self._reconcile(fetched)
+
+  def _reconcile(self, windows, stale=False):
+    """brings the rows up to date with a snapshot, marked if stale"""
 
     # FIXME if the browser is closed and all windows thus get deselected, tab list must be cleared
 
     # TODO read enough closed windows to fill list
       # _, terminal_height = Screen().get_cols_rows()
 
-    self.windows = get_windows()
+    if windows is self.windows: # snapshot unchanged
+      return
 
-    window_ids = list(self.windows.keys())
+    query = self.filter_query
 
-    window_count = len(self)
+    by_site = self.by_site
 
-    index = 0
+    focused = self[self.focus].id if self.focus is not None else None
 
-    while index < window_count:
+    selected = set(self.selected) # ungrouping unchecks sites
 
-      window_id = self[index].id
+    with span("rebuild", windows=len(windows)):
+      self.ungroup() # so that every window's row is brought up to date
+      self.unfilter()
+      self._rebuild(windows, stale)
+      if query is not None:
+        self.filter(query, focus_best=False)
+      if by_site:
+        self.group_by_site(focused=focused, selected=selected)
 
-      if window_id not in window_ids:
-        # with open("/tmp/debug", 'a') as debug:
-          # debug.write(f"removing window {window_id} at index {index}\n")
-        del self[index]
-        window_count -= 1
+    if self.on_reconciled is not None:
+      self.on_reconciled()
 
-      else:
+  def _rebuild(self, windows, stale):
+
+    previous, self.windows = self.windows, windows
 
-        tab_count = len(self.windows[window_id])
-        checkbox = self[index].base_widget
-        checkbox.set_label(f"{tab_count} tab{'s' if tab_count > 1 else ''}")
+    self.tabs = index_tabs(windows)
 
-        index += 1
+    self.search_index.update(windows)
 
-    listed_window_ids = [window.id for window in self]
+    self.duplicate_index.update(windows)
 
-    unlisted_windows = list(set(window_ids) - set(listed_window_ids))
+    closed = []
 
-    for window_id in unlisted_windows:
+    for row in self:
 
-      tabs = self.windows[window_id]
+      if row.id not in windows:
+        closed.append(row.id)
+
+      elif len(windows[row.id]) != len(previous[row.id]):
+        tab_count = len(windows[row.id])
+        row.base_widget.set_label(
+          f"{tab_count} tab{'s' if tab_count > 1 else ''}")
+
+    self.remove_windows(closed)
+
+    rows = []
+
+    for window_id, tabs in windows.items():
+
+      if self.position(window_id) is not None:
+        continue
 
       tab_count = len(tabs)
 
@@ -128,10 +458,46 @@ class WindowListWalker(SimpleFocusListWalker):
 
       attribute_map.id = window_id
 
-      # with open("/tmp/debug", 'a') as debug:
-        # debug.write(f"adding window {window_id} at index {len(self)}\n")
+      connect_signal(obj       = checkbox,
+                     name      = "change",
+                     callback  = self._toggled,
+                     user_args = [window_id])
+
+      rows.append(attribute_map)
+
+    filling = len(self) == 0
+
+    self.extend(rows)
+
+    if filling and rows: # extending an empty list focuses its last row
+      self.set_focus(0)
+
+    self.stale = stale
+
+    self._update_window_count()
+
+    self._update_tab_list() # tabs of the focused window may have changed
 
-      self.append(attribute_map)
+  def _update_window_count(self):
+
+    duplicates = self.duplicate_index.count
+
+    duplicate_count = (f", {duplicates} dupe{'s' if duplicates > 1 else ''}"
+                       if duplicates else '') # short, as the column is narrow
+
+    if self.by_site:
+      tab_count = sum([len(window) for window in self.windows.values()])
+      self.window_count.set_text(
+        f" {len(self)} site{'s' if len(self) != 1 else ''}, "
+        f"{tab_count} tab{'s' if tab_count != 1 else ''}"
+        + duplicate_count
+        + (" (cached)" if self.stale else ''))
+      return
+
+    if self.filter_query is not None:
+      self.window_count.set_text(
+        f" {len(self)} of {len(self.windows)} windows match")
+      return
 
     tab_count = sum([len(window) for window in self.windows.values()])
 
@@ -139,12 +505,151 @@ class WindowListWalker(SimpleFocusListWalker):
       markup = (  f" {len(self.windows)} "
                 + "window" + ('s' if len(self.windows) > 1 else '') + ", "
                 + f"{tab_count} "
-                + "tab" + ('s' if tab_count > 1 else '')))
+                + "tab" + ('s' if tab_count > 1 else '')
+                + duplicate_count
+                + (" (cached)" if self.stale else '')))
+
+  def filter(self, query, focus_best=True):
+    """narrows the rows to the windows matching query (see SearchIndex.filter),
+       best first, and the tab list to their matching tabs,
+       focusing the best match, or else keeping the focus where it was;
+       an empty query lists every window again"""
+
+    if not query.strip():
+      self.unfilter()
+      return
+
+    self.ungroup()
+
+    with span("filter", query=query):
+
+      if self._unfiltered is None:
+        self._unfiltered = list(self)
+
+      focused = self[self.focus].id if self.focus is not None else None
+
+      rows = {row.id: row for row in self._unfiltered}
+
+      self.filter_query = query
+
+      self[:] = [rows[window_id]
+                 for window_id in self.search_index.filter(query)
+                 if window_id in rows]
 
-    # with open("/tmp/debug", 'a') as debug:
-      # debug.write("\n")
+      if len(self) > 0:
+        position = None if focus_best else self.position(focused)
+        self.set_focus(position or 0)
+
+      self._update_window_count()
+
+  def group_by_site(self, focused=None, selected=()):
+    """lists sites instead of windows, each with its tabs in every window,
+       most tabs first, focusing the given site if listed,
+       and checking those selected which still have tabs open"""
+
+    if self.by_site:
+      return
+
+    self.unfilter()
+
+    self._clear_selection()
+
+    self._window_rows = list(self)
+
+    self._window_focus = self.focus
+
+    with span("group by site", windows=len(self.windows)):
+      self.domain_index.update(self.windows)
+
+    rows = []
+
+    for url_domain, tab_count, window_count in self.domain_index.domains():
+
+      checkbox = CheckBox(
+        label = f"{tab_count} {url_domain}"
+                + (f" ({window_count} windows)" if window_count > 1 else ''))
+
+      attribute_map = AttrMap(w         = checkbox,
+                              attr_map  = "window browser",
+                              focus_map = "focused")
+
+      attribute_map.id = url_domain
+
+      connect_signal(obj       = checkbox,
+                     name      = "change",
+                     callback  = self._toggled,
+                     user_args = [url_domain])
+
+      if url_domain in selected:
+        checkbox.set_state(True)
+
+      rows.append(attribute_map)
+
+    self.by_site = True
+
+    self[:] = rows
+
+    if rows:
+      self.set_focus(self.position(focused) or 0)
+
+    self._update_window_count()
+
+  def ungroup(self):
+    """lists windows again, as before grouping by site"""
+
+    if not self.by_site:
+      return
+
+    self._clear_selection()
+
+    self.by_site = False
+
+    self[:], self._window_rows = self._window_rows, None
+
+    if len(self) > 0:
+      self.set_focus(min(self._window_focus or 0, len(self) - 1))
+
+    self._update_window_count()
+
+  def _clear_selection(self):
+    """unchecks every row, as window and site rows are not selected together"""
+
+    for row in self:
+      row.base_widget.set_state(False)
+
+  def window(self, row_id):
+    """the tabs of a row as a window to save or close,
+       titled by its site when listing sites"""
+
+    if self.by_site:
+      return {"title": row_id,
+              "tabs":  self.domain_index.tabs(row_id)}
+
+    return {"title": None, # TODO
+            "tabs":  self.windows[row_id]}
+
+  def unfilter(self):
+    """lists every window again, keeping the focus on the same window"""
+
+    if self._unfiltered is None:
+      return
+
+    focused = self[self.focus].id if self.focus is not None else None
+
+    self.filter_query = None
+
+    self[:], self._unfiltered = self._unfiltered, None
+
+    if len(self) > 0:
+      self.set_focus(self.position(focused) or 0)
+
+    self._update_window_count()
 
   def _update_tab_list(self):
+    with span("tab list"):
+      self._show_focused_tabs()
+
+  def _show_focused_tabs(self):
 
     if self.focus is None:
 
@@ -158,30 +663,52 @@ class WindowListWalker(SimpleFocusListWalker):
 
         window_id = focused_item.id
 
-        self.tab_list_walker.clear()
+        if self.by_site:
+
+          tabs = self.domain_index.tabs(window_id)
+
+          self.tab_list_walker.set_tabs(tabs)
+
+          window_count = len({tab["id"].rsplit('.', maxsplit=1)[0]
+                              for tab in tabs})
+
+          self.tab_count.set_text(
+            f" {len(tabs)} tab{'s' if len(tabs) != 1 else ''}"
+            + (f" in {window_count} windows" if window_count > 1 else ''))
+
+        elif window_id not in self.windows:
+          self.tab_list_walker.clear()
+
+        else:
+
+            tabs = self.windows[window_id]
+
+            tab_count = len(tabs)
+
+            if self.filter_query is None:
 
-        if window_id in self.windows:
+              self.tab_list_walker.set_tabs(tabs)
 
-            # TODO different colors for title & url
-            self.tab_list_walker.extend([SelectableIcon(tab["title"] +
-                                                        f" [{tab['url']}]")
-                                         for tab in self.windows[window_id]])
+              self.tab_count.set_text(
+                f" {tab_count} tab{'s' if tab_count > 1 else ''}")
 
-            for item in self.tab_list_walker:
-              item.set_layout(align="left", wrap="ellipsis")
+            else:
 
-            tab_count = len(self.windows[window_id])
+              self.tab_list_walker.set_tabs(
+                [tabs[index]
+                 for index in self.search_index.filter_tabs(window_id)])
 
-            self.tab_count.set_text(
-              f" {tab_count} tab{'s' if tab_count > 1 else ''}")
+              self.tab_count.set_text(
+                f" {len(self.tab_list_walker)} of {tab_count} tabs match")
 
   def _remember_relative_position(self):
 
     if self.focus is not None:
 
-      self._ids_preceding = self.window_ids[:self.focus]
+      # the ids list is replaced rather than modified when rows are removed
+      self._remembered_ids = self.window_ids
 
-      self._ids_following = self.window_ids[(self.focus + 1):]
+      self._remembered_focus = self.focus
 
   def decrement_position(self):
 
@@ -190,14 +717,14 @@ class WindowListWalker(SimpleFocusListWalker):
 
     index = len(self) - 1
 
-    for window_id in reversed(self._ids_preceding):
+    # the nearest window still listed which preceded the focus
+    for remembered in range(self._remembered_focus - 1, -1, -1):
 
-      try:
-        index = self.window_ids.index(window_id)
-      except ValueError:
-        continue
+      position = self.position(self._remembered_ids[remembered])
 
-      break
+      if position is not None:
+        index = position
+        break
 
     self.set_focus(index)
 
@@ -208,14 +735,14 @@ class WindowListWalker(SimpleFocusListWalker):
 
     index = None
 
-    for window_id in self._ids_following:
+    # the nearest window still listed which followed the focus
+    for remembered in range(self._remembered_focus + 1,
+                            len(self._remembered_ids)):
 
-      try:
-        index = self.window_ids.index(window_id)
-      except ValueError:
-        continue
+      index = self.position(self._remembered_ids[remembered])
 
-      break
+      if index is not None:
+        break
 
     if index is None:
 
@@ -229,28 +756,36 @@ class WindowListWalker(SimpleFocusListWalker):
 
 class WindowListBox(ListBox):
 
-  def __init__(self, *args, **kwargs):
+  def __init__(self, *args, time_startup=False, **kwargs):
+    """time_startup: quit once the first listing is shown,
+       leaving the times taken in startup_times"""
 
     super().__init__(*args, **kwargs)
 
+    self._time_startup = time_startup
+
+    self.startup_times = None
+
     tab_listbox = ListBox(body=self.body.tab_list_walker)
 
-    left_column, right_column = [LineBox(Overlay(top_w    = listbox,
-                                                 bottom_w = SolidFill(),
-                                                 align    = "center",
-                                                 width    = ("relative", 100),
-                                                 valign   = "middle",
-                                                 height   = ("relative", 100),
-                                                 left     = 1,
-                                                 right    = 1,
-                                                 ))
+    left_column, right_column = [column(listbox)
                                  for listbox in (self, tab_listbox)]
 
     left_column_frame  = Frame(body   = left_column,
-                               footer = self.body.window_count)
+                               footer = Columns(widget_list=[
+                                 self.body.window_count,
+                                 ("pack", self.body.refresh_indicator)]))
+
+    self._right_footer = Pile(widget_list=[self.body.tab_count])
+
+    self._latencies = Text(markup='')
+
+    self._showing_latencies = False
+
+    self._latency_alarm = None
 
     right_column_frame = Frame(body   = right_column,
-                               footer = self.body.tab_count)
+                               footer = self._right_footer)
 
     self._split_footers = Columns(widget_list=[(32, left_column_frame),
                                                right_column_frame])
@@ -284,13 +819,58 @@ class WindowListBox(ListBox):
     self.main_loop = MainLoop(widget  = self._split_footers,
                               palette = palette)
 
-    # from os.path import isfile
-    # if isfile("/tmp/debug"):
-      # from os import remove
-      # remove("/tmp/debug")
+    self.body.watch(self.main_loop)
+
+    self._archive_view = ArchiveView(main_loop  = self.main_loop,
+                                     on_exit    = self._close_archive_view,
+                                     on_restore = self._restore)
+
+    self._reopening_thread = None
+
+    self._reopening_progress = None
+
+    self._reopening_pipe = self.main_loop.watch_pipe(
+      callback = self._show_reopening_progress)
+
+    self._reported_failures = {}
+
+    self.body.on_reconciled = self._reconciled
+
+    # show the (empty) list as soon as running, and only then fetch tabs
+    self.main_loop.set_alarm_in(sec=0, callback=self._start)
+
+  def _start(self, main_loop, user_data):
+
+    with span("first paint"):
+      main_loop.draw_screen()
+
+    self.body.refresh()
+
+  def _reconciled(self):
+
+    self._report_failures()
+
+    if self._time_startup and self.startup_times is None:
+
+      with span("first render"):
+        self.main_loop.draw_screen()
+
+      self.startup_times = startup_times()
+
+      raise ExitMainLoop()
 
   def keypress(self, size, key):
 
+    with span("keypress", key=key):
+      result = self._keypress(size, key)
+
+    if self._showing_latencies:
+      self._update_latencies()
+
+    return result
+
+  def _keypress(self, size, key):
+
     if key == "meta [":
 
       self._control_sequence = True
@@ -302,7 +882,45 @@ class WindowListBox(ListBox):
       self._control_sequence = False
 
       if key == 'I': # focus gained
-        self.body.update_window_list()
+        self.body.refresh(max_age=0)
+
+      return
+
+    if self._mode == "filter":
+
+      query = self.body.filter_query or ''
+
+      if key == "enter": # keep the filter, to act on the windows left
+        self._mode = "normal"
+        self.main_loop.widget = self._split_footers
+        return
+
+      if key == "esc" or (key == "backspace" and not query):
+        self.body.unfilter()
+        self._mode = "normal"
+        self.main_loop.widget = self._split_footers
+        return
+
+      if key in ("up", "ctrl p"):
+        self.body.decrement_position()
+        return
+
+      if key in ("down", "ctrl n"):
+        self.body.increment_position()
+        return
+
+      if key == "backspace":
+        query = query[:-1]
+      elif key == "ctrl u":
+        query = ''
+      elif len(key) == 1:
+        query += key
+      else:
+        return
+
+      self._status_bar.set_text(f"filter: {query}█")
+
+      self.body.filter(query)
 
       return
 
@@ -343,7 +961,7 @@ class WindowListBox(ListBox):
       else:
         self._status_bar.set_text(self._status_bar.text[:-1] + key + '█')
 
-      self._search_query = self._status_bar.text[1:-1].lower()
+      self._search_query = self._status_bar.text[1:-1]
 
       self._search()
 
@@ -354,7 +972,15 @@ class WindowListBox(ListBox):
 
     self.main_loop.widget = self._split_footers # hide any recent status
 
-    self.body.update_window_list()
+    # keep the listing recent enough
+    if key in ("enter", 'c', 'd', 's', 'w', 'x'):
+
+      self.body.refresh()
+
+      if key != "enter" and self.body.stale: # might close the wrong tabs
+        self._set_status(status="still loading the current windows, "
+                                "try again in a moment")
+        return
 
     # TODO allow click to select but not check
 
@@ -384,6 +1010,40 @@ class WindowListBox(ListBox):
 
       return
 
+    if key == 'a':
+      self._archive_view.open()
+      return
+
+    if key == 'L':
+      self._toggle_latencies()
+      return
+
+    if key == 'u':
+      self._reopen_in_background(label    = "undoing",
+                                 function = undo)
+      return
+
+    if key == 'f':
+      self._set_status(f"filter: {self.body.filter_query or ''}█")
+      self._mode = "filter"
+      return
+
+    if key == "esc":
+      self.body.unfilter()
+      self.body.ungroup()
+      return
+
+    if key == 'D':
+
+      if self.body.by_site:
+        self.body.ungroup()
+      else:
+        self.body.group_by_site()
+
+      self.body.refresh() # keep the listing recent enough to act on
+
+      return
+
     if key == 'n':
 
       if self.focus is not None:
@@ -407,7 +1067,15 @@ class WindowListBox(ListBox):
       return
 
     if key == "enter":
-      focus_window(self.body[self.focus_position].id)
+
+      window_id = self.body[self.focus_position].id
+
+      if self.body.by_site: # the window of the site's first tab
+        window_id = self.body.domain_index.tabs(window_id)[0]["id"] \
+                      .rsplit('.', maxsplit=1)[0]
+
+      focus_window(window_id = window_id,
+                   tabs      = self.body.tabs)
       return
 
     if key == ' ':
@@ -432,15 +1100,29 @@ class WindowListBox(ListBox):
       self.focus_position = len(self.body) - 1
       return
 
+    if key == 'x':
+
+      duplicates = self.body.duplicate_index.extra_tabs()
+
+      if not duplicates:
+        self._set_status(status="no duplicate tabs")
+        return
+
+      status = close_duplicates(tabs = duplicates)
+
+      self._set_status(status=status)
+
+      self.body.refresh()
+
+      return
+
     if key == 'd':
 
       status = close(windows = self._selected_windows)
 
       self._set_status(status=status)
 
-      self.body.update_window_list()
-
-      self.focus_position = self.focus_position # trigger update tab list
+      self.body.refresh()
 
       return
 
@@ -450,6 +1132,8 @@ class WindowListBox(ListBox):
 
       self._update_and_set_status(status=status)
 
+      self.body.refresh()
+
       return
 
     if key == 'w':
@@ -499,9 +1183,9 @@ class WindowListBox(ListBox):
 
       self._set_status(status=status)
 
-      self.body.update_window_list()
+      self.body.refresh()
 
-      self.focus_position = 0 # trigger update tab list
+      self.focus_position = 0
 
     # TODO keys to switch between window & tabs list
       # key to toggle (tab?)
@@ -517,64 +1201,57 @@ class WindowListBox(ListBox):
     if reverse is True:
       search_forwards = not search_forwards
 
-    window_list = []
+    if self._search_query is None or len(self.body) == 0:
+      return
 
-    if len(self.body) > 0:
-      window_list = [*self.body[self._focus_position_before_search + 1: ],
-                     *self.body[:self._focus_position_before_search]]
-
-    if search_forwards is False:
-      window_list = reversed(window_list)
-
-    for window in window_list:
-      tab_list = self.body.windows[window.id]
-      if search_forwards is False:
-        tab_list = reversed(tab_list)
-      for tab in tab_list:
-        if self._search_query in tab["title"].lower():
-          self.focus_position = self.body.index(window)
-          # TODO select the particular tab
-            # TODO make tabs even selectable/browsable at all
-          return
+    matches = self.body.search_index.search(self._search_query)
+
+    step = 1 if search_forwards else -1
+
+    # from the window after (or before) the starting one, wrapping around
+    for offset in range(1, len(self.body)):
+      index = (self._focus_position_before_search + step * offset) \
+              % len(self.body)
+      if self.body[index].id in matches:
+        self.focus_position = index
+        # TODO select the particular tab
+          # TODO make tabs even selectable/browsable at all
+        return
 
   @property
   def _selected_window_ids(self):
 
-    selected_window_ids = []
+    positions = []
+
+    for window_id in self.body.selected:
 
-    for item in self.body:
-      checkbox = item.base_widget
-      if checkbox.state == True:
-        selected_window_ids.append(item.id)
+      position = self.body.position(window_id)
 
-    if len(selected_window_ids) == 0:
-      selected_window_ids.append(self.body[self.focus_position].id)
+      if position is not None: # not hidden by a filter
+        positions.append((position, window_id))
 
-    return selected_window_ids
+    if positions:
+      return [window_id for position, window_id in sorted(positions)]
+
+    return [self.body[self.focus_position].id]
 
   @property
   def _selected_windows(self):
 
     # FIXME handle window(s) already closed
 
-    return [{"title": None, # TODO
-             "tabs": self.body.windows[window_id]}
-             for window_id in self._selected_window_ids]
+    return [self.body.window(window_id)
+            for window_id in self._selected_window_ids]
 
   @property
   def _all_windows(self):
 
     # FIXME handle window(s) already closed
 
-    return [{"title": None, # TODO
-             "tabs": self.body.windows[item.id]}
-             for item in self.body]
+    return [self.body.window(item.id) for item in self.body]
 
   def _write_windows(self, save_prompt):
 
-    # with open("/tmp/debug", 'a') as debug:
-      # debug.write("_write_windows()\n")
-
     name = save_prompt.get_edit_text()
 
     save_prompt.set_caption('')
@@ -584,6 +1261,181 @@ class WindowListBox(ListBox):
 
     self._update_and_set_status(status=status)
 
+    self.body.refresh()
+
+  def _report_failures(self):
+    """notes browsers left out of the listing, or back in it, once"""
+
+    failures = snapshot.failures
+
+    if failures == self._reported_failures:
+      return
+
+    if self.main_loop.widget is not self._split_footers:
+      return # not while searching or prompting, so at the next refresh
+
+    if failures:
+      self._set_status("; ".join(f"{prefix} {reason}" for prefix, reason
+                                 in sorted(failures.items()))
+                       + " - showing the other browsers' windows")
+
+    self._reported_failures = failures
+
+  def _toggle_latencies(self):
+    """shows or hides mediator and keypress latencies under the tab list"""
+
+    self._showing_latencies = not self._showing_latencies
+
+    if self._showing_latencies:
+      self._right_footer.contents.append((self._latencies,
+                                          self._right_footer.options()))
+      self._update_latencies()
+
+    else:
+      del self._right_footer.contents[1:]
+
+  def _update_latencies(self, *args):
+    """also runs once a second, while shown"""
+
+    if not self._showing_latencies:
+      return
+
+    lines = []
+
+    for name, durations in sorted(latencies.items()):
+
+      if not name.startswith("rpc "):
+        continue
+
+      prefix = name[len("rpc "):]
+
+      client = get_session().client(prefix)
+
+      lines.append(f" {prefix} {client.browser if client else '(gone)'}: "
+                   + summary(durations))
+
+    keypresses = latencies["keypress"]
+
+    lines.append(" keys: " + summary(keypresses))
+
+    lines.append(" keys: "
+                 + ' '.join((f"<{milliseconds(bound)}"
+                             if bound in histogram_bounds
+                             else f">{milliseconds(histogram_bounds[-1])}")
+                            + f":{count}"
+                            for bound, count in keypresses.histogram()
+                            if count))
+
+    self._latencies.set_text("\n".join(lines))
+
+    if self._latency_alarm is not None:
+      self.main_loop.remove_alarm(self._latency_alarm)
+
+    self._latency_alarm = self.main_loop.set_alarm_in(
+      sec      = 1,
+      callback = self._update_latencies)
+
+  def _close_archive_view(self):
+    self.main_loop.widget = self._split_footers
+
+  def _restore(self, path, into_focused_window=False):
+    """reopens a saved window's tabs,
+       in a new window of the focused window's browser, or in that window"""
+
+    self._close_archive_view()
+
+    session = get_session()
+
+    prefix, window_id = None, None
+
+    if len(self.body) > 0:
+
+      window_id = self.body[self.focus_position].id
+
+      if self.body.by_site: # the window of the site's first tab
+        window_id = self.body.domain_index.tabs(window_id)[0]["id"] \
+                      .rsplit('.', maxsplit=1)[0]
+
+      prefix, window_id = window_id.split('.')
+      prefix += '.'
+
+    if prefix is None or session.client(prefix) is None: # or since gone
+
+      if not session.clients:
+        self._set_status("no browser to restore into")
+        return
+
+      prefix, window_id = session.clients[0].prefix, None
+
+    if not into_focused_window:
+      window_id = None
+
+    self._reopen_in_background(
+      label    = f"restoring {path}",
+      function = lambda progress: restore(path      = join(folder, path),
+                                          prefix    = prefix,
+                                          window_id = window_id,
+                                          progress  = progress))
+
+  def _reopen_in_background(self, label, function):
+    """runs function (restore or undo) in a background thread,
+       passing it a progress callback shown in the status bar"""
+
+    if self._reopening_thread is not None:
+      self._set_status(f"still {self._reopening_progress[0]}")
+      return
+
+    self._reopening_progress = (label, 0, None)
+
+    self._show_reopening_progress()
+
+    def run():
+
+      def progress(opened, total):
+        self._reopening_progress = (label, opened, total)
+        write(self._reopening_pipe, b'.')
+
+      try:
+        status = function(progress)
+      except Exception as error: # e.g. the browser went away
+        status = error
+
+      self._reopening_progress = (label, status, None)
+
+      write(self._reopening_pipe, b'.')
+
+    self._reopening_thread = Thread(target=run, daemon=True)
+
+    self._reopening_thread.start()
+
+  def _show_reopening_progress(self, data=None):
+    """runs in the main loop whenever the reopening thread has progressed"""
+
+    label, opened, total = self._reopening_progress
+
+    if not isinstance(opened, int): # done, with a status or an error
+
+      self._reopening_thread.join()
+
+      self._reopening_thread = None
+
+      self._set_status(opened)
+
+      self.body.refresh(max_age=0)
+
+      return
+
+    # not over a search, a prompt or the archive view
+    if (    self.main_loop.widget is not self._split_footers
+        and (   self._mode != "normal"
+             or self.main_loop.widget is not self._single_footer
+             or self._single_footer.footer is not self._status_bar)):
+      return
+
+    self._set_status(f"{label}: {opened}"
+                     + (f"/{total}" if total is not None else '')
+                     + " tabs")
+
   def _set_status(self, status):
 
     self._status_bar.set_text(str(status))
@@ -603,59 +1455,205 @@ class WindowListBox(ListBox):
 
     if not isinstance(status, HTTPError):
 
-      focus_position = self.focus_position
+      self.body.remove_windows(self._selected_window_ids)
 
-      # with open("/tmp/debug", 'a') as debug:
-        # debug.write(f"current focus: {self.body[focus_position].id} "
-                    # f"at index {focus_position}\n")
+      self._single_footer.focus_position = "body"
 
-      window_count = len(self.body)
+class ArchiveView(Frame):
+  """searches saved windows as you type, through the archive's index"""
 
-      index = 0
+  def __init__(self, main_loop, on_exit, on_restore):
 
-      selected_window_ids = [window_id for window_id
-                             in self._selected_window_ids]
+    self._main_loop = main_loop
 
-      while index < window_count:
+    self._on_exit = on_exit
 
-        window_id = self.body[index].id
+    self._on_restore = on_restore # called with the path of a saved window
 
-        if window_id in selected_window_ids:
+    self._results = SimpleFocusListWalker(contents=[])
 
-          if ((index < focus_position and focus_position > 0)
-              or (focus_position == len(self.body) - 1)):
-            focus_position -= 1
+    self._tabs = SimpleFocusListWalker(contents=[])
 
-          # with open("/tmp/debug", 'a') as debug:
-            # debug.write(f"removing window {window_id} at index {index}\n")
+    self._query = Edit(caption="archive: ")
 
-          del self.body[index]
+    self._indexing = Text(markup='')
 
-          window_count -= 1
+    self._report = None
 
-        else:
-          index += 1
+    self._sync_pipe = main_loop.watch_pipe(callback=self._synced)
 
-      # with open("/tmp/debug", 'a') as debug:
-        # debug.write(f"new focus: {self.body[focus_position].id} "
-                    # f"at index {self.focus_position}\n")
+    columns = Columns(widget_list=[(32, column(ListBox(body=self._results))),
+                                   column(ListBox(body=self._tabs))])
 
-      self.focus_position = self.focus_position
+    super().__init__(body       = columns,
+                     footer     = Columns(widget_list=[
+                                    self._query,
+                                    ("pack", self._indexing)]),
+                     focus_part = "footer")
 
-      self._single_footer.focus_position = "body"
+    connect_signal(obj      = self._query,
+                   name     = "postchange",
+                   callback = self._search)
 
-    # with open("/tmp/debug", 'a') as debug:
-      # debug.write("\n")
+    connect_signal(obj      = self._results,
+                   name     = "modified",
+                   callback = self._show_tabs)
+
+  def open(self):
+
+    self._main_loop.widget = self
+
+    # catch up with archive files changed outside of tab_wrangler
+    self._indexing.set_text(" indexing…")
+
+    Thread(target=self._sync, daemon=True).start()
+
+  def keypress(self, size, key):
+
+    if key == "esc":
+      self._query.set_edit_text('')
+      self._on_exit()
+      return
+
+    if key in ("enter", "meta enter"): # meta: into the focused window
+      if self._results.focus is not None:
+        path = self._results[self._results.focus].path
+        self._query.set_edit_text('')
+        self._on_restore(path, into_focused_window=(key == "meta enter"))
+      return
+
+    if key in ("up", "ctrl p"):
+      if self._results.focus is not None and self._results.focus > 0:
+        self._results.set_focus(self._results.focus - 1)
+      return
+
+    if key in ("down", "ctrl n"):
+      if (    self._results.focus is not None
+          and self._results.focus < len(self._results) - 1):
+        self._results.set_focus(self._results.focus + 1)
+      return
+
+    return super().keypress(size, key)
+
+  def _sync(self):
+    """runs in a background thread"""
+    get_index().sync()
+    self._report = get_urls().report()
+    write(self._sync_pipe, b'.')
+
+  def _synced(self, data):
+
+    url_count, skipped_tabs, skipped_bytes = self._report
+
+    self._indexing.set_text(
+      f" {url_count} URLs archived"
+      + (f", {skipped_tabs} duplicates ({skipped_bytes / 1024:.0f} KiB) "
+         "left out" if skipped_tabs else ''))
+
+    self._search()
+
+  def _search(self, *args):
+
+    results = []
+
+    for path, match_count in get_index().search(self._query.edit_text):
+
+      result = AttrMap(w         = SelectableIcon(f"{path} ({match_count})"),
+                       attr_map  = "window browser",
+                       focus_map = "focused")
+
+      result.original_widget.set_layout(align="left", wrap="ellipsis")
+
+      result.path = path
+
+      results.append(result)
+
+    self._results[:] = results
+
+    if results:
+      self._results.set_focus(0)
+
+    self._show_tabs()
+
+  def _show_tabs(self):
+
+    self._tabs.clear()
+
+    if self._results.focus is None:
+      return
+
+    path = join(folder, self._results[self._results.focus].path)
+
+    try:
+      tabs = read_tabs(path)
+    except OSError: # since deleted or moved
+      return
+
+    self._tabs.extend([SelectableIcon(f"{title} [{url}]")
+                       for title, url in tabs])
+
+    for item in self._tabs:
+      item.set_layout(align="left", wrap="ellipsis")
+
+def startup_times():
+  """how long each stage of starting up took"""
+
+  stages = [("import", imported_at - started_at)]
+
+  for stage in ("load snapshot", "first paint", "connect", "fetch", "parse", "rebuild",
+                "first render"):
+    stages.append((stage, latencies[stage].last))
+
+  stages.append(("total", perf_counter() - started_at))
+
+  return "\n".join(f"{stage:<12} {milliseconds(duration):>8}"
+                   for stage, duration in stages)
+
+def summary(durations):
+  """the last and percentile durations, for showing latencies"""
+
+  return ' '.join([f"last {milliseconds(durations.last)}",
+                   *[f"p{percent} {milliseconds(durations.percentile(percent))}"
+                     for percent in (50, 95, 99)],
+                   f"({len(durations)})"])
+
+def column(listbox):
+  """a bordered column with a margin, for either side of the screen"""
+
+  return LineBox(Overlay(top_w    = listbox,
+                         bottom_w = SolidFill(),
+                         align    = "center",
+                         width    = ("relative", 100),
+                         valign   = "middle",
+                         height   = ("relative", 100),
+                         left     = 1,
+                         right    = 1,
+                         ))
 
 palette = [("window browser", "default",    "default"),
            ("focused",        "black",      "light gray"),
            ("tab browser",    "dark green", "default")]
 
-terminal_title = "tabwrangler"
-print(f'\33]0;{terminal_title}\a', end='', flush=True)
+if __name__ == "__main__":
+
+  terminal_title = "tabwrangler"
+  print(f'\33]0;{terminal_title}\a', end='', flush=True)
+
+  print('\x1b[?1004h', end='') # enable focus events
+  register(lambda: print('\x1b[?1004l', end='')) # disable focus events atexit
+  # https://unix.stackexchange.com/a/480138/85161
+
+  register(shutdown) # close mediator connections
+  register(close_archive)
+  register(close_journal)
+  register(close_trace)
+
+  snapshot.persist(snapshot_path) # shown at once, until refreshed
+
+  window_list_box = WindowListBox(body         = WindowListWalker(),
+                                  time_startup = time_startup)
 
-print('\x1b[?1004h', end='') # enable focus events
-register(lambda: print('\x1b[?1004l', end='')) # disable focus events atexit
-# https://unix.stackexchange.com/a/480138/85161
+  window_list_box.main_loop.run()
 
-WindowListBox(body=WindowListWalker()).main_loop.run()
+  if time_startup:
+    print(window_list_box.startup_times, file=stderr)
@@ -0,0 +1,481 @@
+#!/bin/env python
+
+from fcntl import LOCK_EX, flock
+from hashlib import blake2b
+from os import O_CREAT, O_RDWR, listdir, makedirs, remove, truncate, walk
+from os import open as open_file
+from os.path import dirname, expanduser, getsize, isfile, join, relpath
+from re import match
+from sqlite3 import OperationalError, connect
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+folder = join(expanduser('~'), "urls-tab_wrangler") # made once first needed
+
+skip_archived_urls = False # when saving, leave out URLs saved before
+
+use_bloom_filter = True # answer most "saved before?" lookups from memory
+
+sync_batch = 50 # files indexed per transaction, holding the index's lock
+
+def allocate_index(subfolder: str) -> int:
+  """the next free number for naming an untitled window saved in subfolder
+
+  The next number is kept in the subfolder's .next_index file,
+  locked while in use so concurrent instances never hand out the same one.
+  Only a subfolder without that file yet has to be scanned, once.
+  """
+
+  with open(open_file(join(subfolder, ".next_index"), O_RDWR | O_CREAT),
+            'r+') as counter:
+
+    flock(counter, LOCK_EX) # released on closing
+
+    contents = counter.read().strip()
+
+    if contents:
+      index = int(contents)
+
+    else:
+      index = max([int(filename)
+                   for filename in listdir(subfolder)
+                   if match(r"^[0-9]+$", filename)],
+                  default = -1) + 1
+
+    counter.seek(0)
+    counter.truncate()
+    counter.write(f"{index + 1}\n")
+
+  return index
+
+def read_tabs(path: str, offset: int = 0) -> List[Tuple[str, str]]:
+  """(title, url) pairs saved in an archive file, from a byte offset on"""
+
+  with open(path, 'rb') as archive_file:
+    archive_file.seek(offset)
+    contents = archive_file.read().decode(errors="replace")
+
+  tabs = []
+
+  for line in contents.splitlines():
+    if line:
+      title, _, url = line.partition("\t")
+      tabs.append((title, url))
+
+  return tabs
+
+def iter_tabs(path: str) -> Iterator[Tuple[str, str]]:
+  """(title, url) pairs saved in an archive file, read only as needed"""
+
+  with open(path, 'rb') as archive_file:
+    for line in archive_file:
+      line = line.decode(errors="replace").rstrip("\n")
+      if line:
+        title, _, url = line.partition("\t")
+        yield title, url
+
+def count_tabs(path: str) -> int:
+
+  with open(path, 'rb') as archive_file:
+    return sum(1 for line in archive_file if line.strip(b"\n"))
+
+def revert_append(path:          str,
+                  size:          int,
+                  appended_size: int,
+                  new_urls:      List[str] = None
+                  ) -> bool:
+  """takes back an append to an archive file, truncating it to its size before
+     (or removing it, if size is None, as it was new),
+     unless it has changed since it was appended_size long
+
+  new_urls, those the append archived for the first time, are forgotten
+  by the URL index, so that saving them again doesn't leave them out.
+  If not known, every URL appended is.
+  """
+
+  if not isfile(path) or getsize(path) != appended_size:
+    return False
+
+  if new_urls is None:
+    new_urls = [url for title, url in read_tabs(path, offset=size or 0)]
+
+  get_urls().remove(new_urls)
+
+  if size is None:
+    remove(path)
+    get_index().remove_file(path)
+
+  else:
+    truncate(path, size)
+    get_index().update_file(path)
+
+  return True
+
+class ArchiveIndex:
+  """full-text index over the titles and URLs of every saved window
+
+  Kept in an SQLite database in the archive folder, using FTS5 if available.
+  Archive files are only ever appended to,
+  so a file which has grown is brought up to date
+  by indexing only the lines past its previously indexed size.
+  """
+
+  def __init__(self, path: str = join(folder, ".index.sqlite3")):
+
+    self._lock = Lock()
+
+    makedirs(dirname(path), exist_ok=True)
+
+    self._database = connect(path, check_same_thread=False)
+
+    with self._database:
+
+      self._database.execute("CREATE TABLE IF NOT EXISTS files "
+                             "(path TEXT PRIMARY KEY, size INTEGER)")
+
+      try:
+        self._database.execute("CREATE VIRTUAL TABLE IF NOT EXISTS tabs "
+                               "USING fts5(title, url, file UNINDEXED)")
+        self.full_text = True
+
+      except OperationalError: # sqlite built without FTS5
+        self._database.execute("CREATE TABLE IF NOT EXISTS tabs "
+                               "(title TEXT, url TEXT, file TEXT)")
+        self._database.execute("CREATE INDEX IF NOT EXISTS tabs_file "
+                               "ON tabs (file)")
+        self.full_text = False
+
+  def close(self) -> None:
+    with self._lock:
+      self._database.close()
+
+  def update_file(self, path: str) -> None:
+    """indexes whatever has been appended to an archive file since last time"""
+
+    with self._lock, self._database:
+      self._update_file(relpath(path, folder), getsize(path))
+
+  def remove_file(self, path: str) -> None:
+
+    path = relpath(path, folder)
+
+    with self._lock, self._database:
+      self._database.execute("DELETE FROM tabs WHERE file = ?", (path,))
+      self._database.execute("DELETE FROM files WHERE path = ?", (path,))
+
+  def sync(self) -> None:
+    """brings the whole index up to date with the archive folder
+
+    Files are indexed sync_batch at a time, each batch in its own
+    transaction, so that searches and saves meanwhile wait on the lock
+    for one batch at most, rather than for the whole archive.
+    """
+
+    sizes: Dict[str, int] = {}
+
+    for directory, subdirectories, filenames in walk(folder):
+
+      subdirectories[:] = [subdirectory for subdirectory in subdirectories
+                           if not subdirectory.startswith('.')]
+
+      for filename in filenames:
+        if not filename.startswith('.'):
+          path = join(directory, filename)
+          sizes[relpath(path, folder)] = getsize(path)
+
+    with self._lock, self._database:
+
+      indexed = dict(self._database.execute("SELECT path, size FROM files"))
+
+      for path in indexed.keys() - sizes.keys():
+        self._database.execute("DELETE FROM tabs WHERE file = ?", (path,))
+        self._database.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    changed = [(path, size) for path, size in sizes.items()
+               if indexed.get(path) != size]
+
+    for start in range(0, len(changed), sync_batch):
+      with self._lock, self._database:
+        for path, size in changed[start:start + sync_batch]:
+
+          # sizes as of now, as a save may have appended to (and indexed)
+          # the file since it was listed
+          try:
+            size = getsize(join(folder, path))
+          except OSError: # since removed, to be dropped next time
+            continue
+
+          self._update_file(path, size)
+
+  def search(self, query: str, limit: int = 200) -> List[Tuple[str, int]]:
+    """saved windows with tabs matching every word of the query,
+       as (path relative to the archive folder, matching tab count),
+       best matches first"""
+
+    words = query.split()
+
+    if not words:
+      return []
+
+    with self._lock:
+
+      if self.full_text:
+        # each word as a quoted prefix, so punctuation can't break the syntax
+        return self._database.execute(
+          "SELECT file, count(*) FROM tabs WHERE tabs MATCH ? "
+          "GROUP BY file ORDER BY min(rank) LIMIT ?",
+          (' '.join('"' + word.replace('"', '""') + '"*' for word in words),
+           limit)).fetchall()
+
+      return self._database.execute(
+        "SELECT file, count(*) FROM tabs WHERE "
+        + " AND ".join(["(title || ' ' || url) LIKE ?"] * len(words))
+        + " GROUP BY file ORDER BY count(*) DESC LIMIT ?",
+        (*[f"%{word}%" for word in words], limit)).fetchall()
+
+  def _update_file(self,
+                   path:    str,
+                   size:    int,
+                   indexed: int = -1
+                   ) -> None:
+
+    if indexed == -1:
+      row = self._database.execute("SELECT size FROM files WHERE path = ?",
+                                   (path,)).fetchone()
+      indexed = None if row is None else row[0]
+
+    if indexed == size:
+      return
+
+    if indexed is None: # new
+      indexed = 0
+
+    elif indexed > size: # rewritten: start over
+      # scans the whole table, as file is unindexed, so only done when needed
+      self._database.execute("DELETE FROM tabs WHERE file = ?", (path,))
+      indexed = 0
+
+    self._database.executemany(
+      "INSERT INTO tabs (title, url, file) VALUES (?, ?, ?)",
+      [(title, url, path)
+       for title, url in read_tabs(join(folder, path), offset=indexed)])
+
+    self._database.execute("INSERT OR REPLACE INTO files (path, size) "
+                           "VALUES (?, ?)",
+                           (path, size))
+
+class BloomFilter:
+  """a fixed-size set of 64-bit hashes which may report false positives"""
+
+  def __init__(self, bits: int = 1 << 23, hashes: int = 7):
+
+    self._bits = bytearray(bits // 8)
+
+    self._size = bits
+
+    self._hashes = hashes
+
+  def _positions(self, hash: int) -> Iterable[int]:
+
+    low, high = hash & 0xffffffff, (hash >> 32) & 0xffffffff
+
+    return ((low + number * high) % self._size
+            for number in range(self._hashes))
+
+  def add(self, hash: int) -> None:
+    for position in self._positions(hash):
+      self._bits[position >> 3] |= 1 << (position & 7)
+
+  def __contains__(self, hash: int) -> bool:
+    return all(self._bits[position >> 3] & (1 << (position & 7))
+               for position in self._positions(hash))
+
+  def load(self, path: str, count: int) -> bool:
+    """loads the filter saved with save(), if it held count hashes"""
+
+    if not isfile(path):
+      return False
+
+    with open(path, 'rb') as bloom_file:
+
+      if int.from_bytes(bloom_file.read(8), byteorder="big") != count:
+        return False # saved before the last hashes were added
+
+      return bloom_file.readinto(self._bits) == len(self._bits)
+
+  def save(self, path: str, count: int) -> None:
+    with open(path, 'wb') as bloom_file:
+      bloom_file.write(count.to_bytes(8, byteorder="big"))
+      bloom_file.write(self._bits)
+
+def url_hash(url: str) -> int:
+  """a 64-bit digest of a URL, as a signed integer for SQLite"""
+
+  return int.from_bytes(blake2b(url.encode(), digest_size=8).digest(),
+                        byteorder = "big",
+                        signed    = True)
+
+class UrlIndex:
+  """hashes of every URL ever saved, to recognize tabs already archived
+
+  Kept in an SQLite database in the archive folder,
+  built from the archive files only when the database is first created.
+  A Bloom filter, saved next to it, answers most lookups for new URLs
+  without touching the database. It is saved tagged with how many hashes
+  the database held as far as this instance knows, so that hashes added
+  meanwhile by another instance (which this filter never saw) make the
+  tag stale, and the filter is rebuilt on the next start.
+  """
+
+  def __init__(self,
+               path:         str  = join(folder, ".urls.sqlite3"),
+               bloom_filter: bool = None):
+
+    if bloom_filter is None:
+      bloom_filter = use_bloom_filter
+
+    self._lock = Lock()
+
+    self._bloom_path = path + ".bloom"
+
+    self._bloom_filter = BloomFilter() if bloom_filter else None
+
+    self._known_count = 0 # hashes in the database, as far as this one knows
+
+    new = not isfile(path)
+
+    makedirs(dirname(path), exist_ok=True)
+
+    self._database = connect(path, check_same_thread=False)
+
+    with self._database:
+
+      self._database.execute("CREATE TABLE IF NOT EXISTS urls "
+                             "(hash INTEGER PRIMARY KEY)")
+
+      self._database.execute("CREATE TABLE IF NOT EXISTS skipped "
+                             "(tabs INTEGER, bytes INTEGER)")
+
+      if new:
+
+        self._database.execute("INSERT INTO skipped VALUES (0, 0)")
+
+        for directory, subdirectories, filenames in walk(folder):
+          subdirectories[:] = [subdirectory for subdirectory in subdirectories
+                               if not subdirectory.startswith('.')]
+          for filename in filenames:
+            if not filename.startswith('.'):
+              self._add([url for title, url
+                         in read_tabs(join(directory, filename))])
+
+    self._known_count = self._count()
+
+    if (    self._bloom_filter is not None
+        and not self._bloom_filter.load(self._bloom_path, self._known_count)):
+      for hash, in self._database.execute("SELECT hash FROM urls"):
+        self._bloom_filter.add(hash)
+
+  def __contains__(self, url: str) -> bool:
+
+    hash = url_hash(url)
+
+    if self._bloom_filter is not None and hash not in self._bloom_filter:
+      return False
+
+    with self._lock:
+      return self._database.execute("SELECT 1 FROM urls WHERE hash = ?",
+                                    (hash,)).fetchone() is not None
+
+  def add(self, urls: Iterable[str]) -> None:
+    with self._lock, self._database:
+      self._add(urls)
+
+  def remove(self, urls: Iterable[str]) -> None:
+    """forgets URLs, as when a save is undone
+
+    The Bloom filter keeps their bits, which only costs lookups for them
+    a trip to the database, so it stays valid without being rebuilt.
+    """
+
+    with self._lock, self._database:
+      self._known_count -= self._database.executemany(
+        "DELETE FROM urls WHERE hash = ?",
+        [(url_hash(url),) for url in urls]).rowcount
+
+  def record_skipped(self, tabs: int, bytes: int) -> None:
+    """adds to the tally of what skipping archived URLs has saved"""
+
+    with self._lock, self._database:
+      self._database.execute("UPDATE skipped "
+                             "SET tabs = tabs + ?, bytes = bytes + ?",
+                             (tabs, bytes))
+
+  def report(self) -> Tuple[int, int, int]:
+    """(URLs archived, tabs skipped as already archived, bytes thus saved)"""
+
+    with self._lock:
+      url_count = self._count()
+      tabs, bytes = self._database.execute("SELECT tabs, bytes FROM skipped"
+                                           ).fetchone()
+
+    return url_count, tabs, bytes
+
+  def close(self) -> None:
+
+    with self._lock:
+
+      if self._bloom_filter is not None:
+        self._bloom_filter.save(self._bloom_path, self._known_count)
+
+      self._database.close()
+
+  def _count(self) -> int:
+    return self._database.execute("SELECT count(*) FROM urls").fetchone()[0]
+
+  def _add(self, urls: Iterable[str]) -> None:
+
+    hashes = [url_hash(url) for url in urls]
+
+    self._known_count += self._database.executemany(
+      "INSERT OR IGNORE INTO urls VALUES (?)",
+      [(hash,) for hash in hashes]).rowcount
+
+    if self._bloom_filter is not None:
+      for hash in hashes:
+        self._bloom_filter.add(hash)
+
+_index = None
+
+_urls = None
+
+def get_index() -> ArchiveIndex:
+
+  global _index
+
+  if _index is None:
+    _index = ArchiveIndex()
+
+  return _index
+
+def get_urls() -> UrlIndex:
+
+  global _urls
+
+  if _urls is None:
+    _urls = UrlIndex()
+
+  return _urls
+
+def close_archive() -> None:
+  """closes the archive's databases, saving the Bloom filter"""
+
+  global _index, _urls
+
+  if _index is not None:
+    _index.close()
+    _index = None
+
+  if _urls is not None:
+    _urls.close()
+    _urls = None
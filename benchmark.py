@@ -0,0 +1,483 @@
+#!/bin/env python
+
+# benchmarks against stand-in bt-mediators serving synthetic tabs, e.g.:
+#   python -m tab_wrangler.benchmark --scenario medium --output bench.jsonl
+# each measure is written as one line of JSON, for tracking regressions
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from gc import collect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from os import environ, pathsep
+from random import Random
+from statistics import median
+from subprocess import run
+from sys import executable, path, stdout
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from tracemalloc import get_traced_memory, start, stop
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from urwid import ListBox
+
+
+class Scenario(NamedTuple):
+  browsers: int
+  windows:  int # across all browsers
+  tabs:     int # likewise
+  delay:    float = 0 # seconds each mediator takes to answer
+
+scenarios = {"small":  Scenario(browsers=1, windows=5,    tabs=10),
+             "medium": Scenario(browsers=1, windows=50,   tabs=1000),
+             "large":  Scenario(browsers=2, windows=2000, tabs=50000),
+             "slow":   Scenario(browsers=2, windows=50,   tabs=1000,
+                                delay=0.2)}
+
+screen_size = (120, 50) # columns, rows to render the tab list at
+
+words = ["python", "urwid", "sway", "firefox", "chromium", "tab", "window",
+         "archive", "search", "release", "notes", "issue", "pull", "request",
+         "how", "to", "why", "does", "my", "terminal", "wiki", "docs", "api",
+         "recipe", "bread", "news", "weather", "map", "video", "lecture"]
+
+sites = ["github.com", "en.wikipedia.org", "stackoverflow.com", "youtube.com",
+         "docs.python.org", "news.ycombinator.com", "urwid.org", "swaywm.org"]
+
+class FakeMediator:
+  """an HTTP server answering like one browser's bt-mediator
+
+  Serves a synthetic session of windows of tabs,
+  which close_tabs and open_urls modify until reset().
+  """
+
+  def __init__(self,
+               windows: Dict[int, List[Tuple[int, str, str]]],
+               browser: str   = "firefox",
+               delay:   float = 0):
+
+    self._initial = windows
+
+    self._windows: Dict[int, List[Tuple[int, str, str]]] = {}
+
+    self._lock = Lock()
+
+    self.browser = browser
+
+    self.delay = delay
+
+    self.reset()
+
+    mediator = self
+
+    class Handler(BaseHTTPRequestHandler):
+
+      protocol_version = "HTTP/1.1"
+
+      wbufsize = -1 # one write per response, or Nagle delays small ones
+
+      def do_GET(self):
+        mediator._answer(self, mediator._get(self.path))
+
+      def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        mediator._answer(self, mediator._post(self.path, body))
+
+      def log_message(self, *args):
+        pass
+
+    self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+
+    self._server.daemon_threads = True
+
+    Thread(target = self._server.serve_forever,
+           name   = "fake mediator",
+           daemon = True).start()
+
+  @property
+  def port(self) -> int:
+    return self._server.server_address[1]
+
+  def reset(self) -> None:
+    with self._lock:
+      self._windows = {window_id: list(tabs)
+                       for window_id, tabs in self._initial.items()}
+
+  def stop(self) -> None:
+    self._server.shutdown()
+    self._server.server_close()
+
+  def _answer(self, handler: BaseHTTPRequestHandler, content: str) -> None:
+
+    if self.delay:
+      sleep(self.delay)
+
+    if content is None:
+      handler.send_response(404)
+      handler.send_header("Content-Length", "0")
+      handler.end_headers()
+      return
+
+    body = content.encode("utf8")
+
+    handler.send_response(200)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+  def _get(self, path: str) -> str:
+
+    with self._lock:
+
+      if path == "/get_pid":
+        return "1"
+
+      if path == "/get_browser":
+        return self.browser
+
+      if path == "/list_tabs":
+        return "\n".join(f"{window_id}.{tab_id}\t{title}\t{url}"
+                         for window_id, tabs in self._windows.items()
+                         for tab_id, title, url in tabs)
+
+      if path == "/get_active_tabs":
+        return ",".join(f"{window_id}.{tabs[0][0]}"
+                        for window_id, tabs in self._windows.items())
+
+      if path.startswith("/close_tabs/"):
+
+        closing = {int(tab_id) for tab_id in path.split('/')[2].split(',')}
+
+        for window_id, tabs in list(self._windows.items()):
+
+          tabs[:] = [tab for tab in tabs if tab[0] not in closing]
+
+          if not tabs:
+            del self._windows[window_id]
+
+        return "OK"
+
+    return None
+
+  def _post(self, path: str, body: bytes) -> str:
+
+    if not path.startswith("/open_urls"):
+      return None
+
+    # the single file of brotab's multipart form: the URLs, one per line
+    urls = body.split(b"\r\n\r\n", maxsplit=1)[1] \
+               .rsplit(b"\r\n--", maxsplit=1)[0] \
+               .decode("utf8").splitlines()
+
+    with self._lock:
+
+      tab_id = 1 + max([tab[0] for tabs in self._windows.values()
+                                for tab in tabs],
+                       default = 0)
+
+      if path == "/open_urls":
+        window_id = 1 + max(self._windows, default=0)
+      else:
+        window_id = int(path.split('/')[2])
+
+      self._windows.setdefault(window_id, []).extend(
+        (tab_id + number, "New Tab", url) for number, url in enumerate(urls))
+
+    return "OK"
+
+def synthesize(scenario: Scenario,
+               seed:     int = 0
+               ) -> List[Dict[int, List[Tuple[int, str, str]]]]:
+  """windows of tabs for each browser, spread as evenly as possible"""
+
+  random = Random(seed)
+
+  browsers = [{} for browser in range(scenario.browsers)]
+
+  for window in range(scenario.windows):
+
+    tab_count = (scenario.tabs // scenario.windows
+                 + (window < scenario.tabs % scenario.windows))
+
+    windows = browsers[window % scenario.browsers]
+
+    tab_id = sum([len(tabs) for tabs in windows.values()])
+
+    tabs = windows.setdefault(window + 1, [])
+
+    for tab in range(tab_count):
+
+      title = ' '.join(random.choice(words)
+                       for word in range(random.randint(2, 8)))
+
+      if random.random() < 0.1: # discarded tab
+        title = "💤 " + title
+
+      url = f"https://{random.choice(sites)}/{title.replace(' ', '/')}"
+
+      if random.random() < 0.05: # a duplicate of some earlier tab
+        url = f"https://{random.choice(sites)}/"
+
+      tabs.append((tab_id + tab + 1, title, url))
+
+  return browsers
+
+def measure(function: Callable[[], None],
+            repeat:   int,
+            setup:    Callable[[], None] = None
+            ) -> List[float]:
+  """seconds taken by each of repeat calls of function, after setup"""
+
+  samples = []
+
+  for number in range(repeat):
+
+    if setup is not None:
+      setup()
+
+    start = perf_counter()
+    function()
+    samples.append(perf_counter() - start)
+
+  return samples
+
+def measure_memory(function: Callable[[], object]) -> int:
+  """bytes allocated by function which its result still holds"""
+
+  collect()
+
+  start()
+
+  try:
+    result = function()
+    return get_traced_memory()[0]
+  finally:
+    stop()
+    del result
+
+def parse_as_dicts(lines: List[str]) -> Dict[str, List[dict]]:
+  """tabs listed by mediators as the dicts tabs were before Tab records,
+     for comparing memory use"""
+
+  windows = {}
+
+  for line in lines:
+    identifier, title, url = (line.split("\t") + ['', ''])[:3]
+    windows.setdefault(identifier.rsplit('.', maxsplit=1)[0], []).append(
+      {"id": identifier, "title": title.replace("💤 ", ''), "url": url})
+
+  return windows
+
+def benchmark(name: str, scenario: Scenario, repeat: int) -> List[dict]:
+
+  # imported only once HOME points at a scratch folder to archive to
+  from tab_wrangler.__main__ import WindowListBox, WindowListWalker
+  from tab_wrangler.browser import (BrowserSession,
+                                    _parse,
+                                    get_session,
+                                    get_windows,
+                                    save_and_close,
+                                    set_session,
+                                    shutdown,
+                                    snapshot)
+
+  mediators = [FakeMediator(windows = windows,
+                            browser = ("firefox", "chromium")[number % 2],
+                            delay   = scenario.delay)
+               for number, windows in enumerate(synthesize(scenario))]
+
+  ports = [mediator.port for mediator in mediators]
+
+  def reset():
+    for mediator in mediators:
+      mediator.reset()
+    snapshot.invalidate()
+
+  results = {}
+
+  memory = {}
+
+  try:
+
+    set_session(BrowserSession(ports=ports))
+
+    results["get_windows"] = measure(get_windows, repeat)
+
+    lines = get_session().list_tabs()
+
+    memory["snapshot_memory"] = measure_memory(lambda: _parse(lines))
+
+    memory["snapshot_memory_dicts"] = measure_memory(
+      lambda: parse_as_dicts(lines))
+
+    def start():
+      set_session(BrowserSession(ports=ports))
+      results["window_list_box"] = WindowListBox(body=WindowListWalker())
+      results["window_list_box"].body.update_window_list()
+
+    results["startup"] = measure(start, repeat, setup=shutdown)
+
+    window_list_box = results.pop("window_list_box")
+
+    walker = window_list_box.body
+
+    results["update_window_list"] = measure(
+      lambda: walker.update_window_list(max_age=0), repeat)
+
+    # typing the title of the last window's first tab, key by key
+    query = walker.windows[walker[len(walker) - 1].id][0]["title"]
+
+    def search():
+      for length in range(1, len(query) + 1):
+        window_list_box._search_query = query[:length]
+        start = perf_counter()
+        window_list_box._search()
+        results["_search"].append(perf_counter() - start)
+
+    def start_search():
+      window_list_box._focus_position_before_search = 0
+
+    results["_search"] = []
+
+    measure(search, repeat, setup=start_search)
+
+    tab_listbox = ListBox(body=walker.tab_list_walker)
+
+    tab_list_size = (screen_size[0] - 32, screen_size[1])
+
+    # likewise, narrowing both lists and rendering the tabs left, key by key
+    def filter():
+      for length in range(1, len(query) + 1):
+        start = perf_counter()
+        walker.filter(query[:length])
+        tab_listbox.render(tab_list_size)
+        results["filter"].append(perf_counter() - start)
+
+    results["filter"] = []
+
+    measure(filter, repeat, setup=walker.unfilter)
+
+    walker.unfilter()
+
+    def show_tabs(position):
+      walker.set_focus(position) # updating the tab list
+      tab_listbox.render(tab_list_size)
+
+    results["_update_tab_list"] = [
+      measure(lambda: show_tabs(position % len(walker)), 1)[0]
+      for position in range(repeat)]
+
+    results["save_and_close"] = measure(
+      lambda: save_and_close(windows=[{"title": None,
+                                       "tabs":  next(iter(
+                                                  snapshot.get().values()))}]),
+      repeat,
+      setup = reset)
+
+    results["save_and_close_all"] = measure(
+      lambda: save_and_close(windows=[{"title": None, "tabs": tabs}
+                                      for tabs in snapshot.get().values()]),
+      repeat,
+      setup = reset)
+
+  finally:
+
+    shutdown()
+
+    for mediator in mediators:
+      mediator.stop()
+
+  results["import"] = measure_import("tab_wrangler.__main__", repeat)
+
+  results["import_cli"] = measure_import("tab_wrangler.cli", repeat)
+
+  return [{"scenario": name,
+           "measure":  measure_name,
+           "browsers": scenario.browsers,
+           "windows":  scenario.windows,
+           "tabs":     scenario.tabs,
+           "delay":    scenario.delay,
+           "samples":  len(samples),
+           "min":      min(samples),
+           "median":   median(samples),
+           "max":      max(samples)}
+          for measure_name, samples in results.items()] \
+       + [{"scenario": name,
+           "measure":  measure_name,
+           "browsers": scenario.browsers,
+           "windows":  scenario.windows,
+           "tabs":     scenario.tabs,
+           "delay":    scenario.delay,
+           "bytes":    size,
+           "per_tab":  size / scenario.tabs}
+          for measure_name, size in memory.items()]
+
+def measure_import(module: str, repeat: int) -> List[float]:
+  """seconds taken to import a module, each time in a new interpreter"""
+
+  samples = []
+
+  for number in range(repeat):
+
+    output = run([executable, "-c",
+                  "from time import perf_counter\n"
+                  "start = perf_counter()\n"
+                  f"import {module}\n"
+                  "print(perf_counter() - start)"],
+                 capture_output = True,
+                 check          = True,
+                 text           = True,
+                 env            = {**environ, "PYTHONPATH": pathsep.join(path)})
+
+    samples.append(float(output.stdout))
+
+  return samples
+
+def main() -> None:
+
+  parser = ArgumentParser(prog        = "python -m tab_wrangler.benchmark",
+                          description = "times tab_wrangler against "
+                                        "stand-in bt-mediators")
+
+  parser.add_argument("--scenario",
+                      action  = "append",
+                      choices = scenarios,
+                      help    = "scenario to run (repeatable; default: all)")
+
+  parser.add_argument("--repeat",
+                      type    = int,
+                      default = 5,
+                      help    = "samples per measure (default: %(default)s)")
+
+  parser.add_argument("--output",
+                      help    = "file to append results to (default: stdout)")
+
+  arguments = parser.parse_args()
+
+  run_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+  output = stdout if arguments.output is None else open(arguments.output, 'a')
+
+  with TemporaryDirectory(prefix="tab_wrangler-benchmark-") as home:
+
+    environ["HOME"] = home # so saved windows go to a scratch archive
+
+    try:
+
+      for name in arguments.scenario or scenarios:
+        for result in benchmark(name, scenarios[name], arguments.repeat):
+          output.write(dumps({"run_at": run_at, **result}) + "\n")
+          output.flush()
+
+    finally:
+
+      from tab_wrangler.archive import close_archive
+
+      close_archive()
+
+      if output is not stdout:
+        output.close()
+
+if __name__ == "__main__":
+  main()
@@ -1,22 +1,49 @@
 #!/bin/env python
 
-from asyncio import get_event_loop, new_event_loop, set_event_loop
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import partial
+from itertools import islice
 from json import loads
-from os import listdir, mkdir
-from os.path import expanduser, isdir, isfile, join, relpath
-from re import match
-from subprocess import getoutput, run
-from typing import Dict, List, TypedDict, Union
-
-from brotab.api import MultipleMediatorsAPI
-from brotab.main import create_clients
-from urllib.error import HTTPError
-
+from os import environ, makedirs, replace
+from os.path import (dirname,
+                     expanduser,
+                     getsize,
+                     isdir,
+                     isfile,
+                     join,
+                     relpath)
+from string import ascii_lowercase
+from sys import intern
+from threading import Condition, Lock
+from time import monotonic, sleep
+from typing import (TYPE_CHECKING,
+                    Callable,
+                    Dict,
+                    Iterable,
+                    List,
+                    Tuple,
+                    TypedDict,
+                    Union)
+
+from urllib.error import HTTPError, URLError
+
+from tab_wrangler import archive
+from tab_wrangler.archive import (allocate_index,
+                                  count_tabs,
+                                  folder,
+                                  get_index,
+                                  get_urls,
+                                  iter_tabs,
+                                  revert_append)
+from tab_wrangler.journal import get_journal
+from tab_wrangler.instrumentation import span
+
+if TYPE_CHECKING: # brotab is only imported once connecting (see mediator.py)
+  from tab_wrangler.mediator import MediatorConnection
 
 # TODO warn if bt-mediator down!
 
-# TODO document jq dependency... or replicate its used functionality in python
-
 # TODO indicate which windows belong to which browser
 
 # TODO whitelist/blacklist browser(s)
@@ -26,25 +53,326 @@ ignored_urls = ["about:blank",
                 "https://www.facebook.com/",
                 "https://www.linkedin.com/feed/"]
 
-folder = join(expanduser('~'), "urls-tab_wrangler")
+max_snapshot_age = 30 # seconds a tab listing may be reused before refetching
 
-if not isdir(folder):
-  mkdir(folder)
+fetch_timeout = 3 # seconds each browser is given to list its tabs
 
-class Tab(TypedDict):
-  id:    str
-  title: str
-  url:   str
+restore_batch_size = 10 # tabs opened at once when restoring a saved window
+
+restore_interval = 1 # seconds between those batches, for pages to load
+
+# where the interface keeps the last tab listing, to show it at once next time
+snapshot_path = join(environ.get("XDG_CACHE_HOME")
+                     or join(expanduser('~'), ".cache"),
+                     "tab_wrangler",
+                     "snapshot.tsv")
+
+class Tab:
+  """one tab of a snapshot, read like the dict it once was (tab["url"])
+
+  Slotted, as a session may have tens of thousands of them.
+  """
+
+  __slots__ = ("id", "title", "url")
+
+  def __init__(self, id: str, title: str, url: str):
+    self.id    = id
+    self.title = title
+    self.url   = url
+
+  def __getitem__(self, key: str) -> str:
+
+    if key not in self.__slots__:
+      raise KeyError(key)
+
+    return getattr(self, key)
+
+  def keys(self):
+    """the fields, so that dict(tab) and {**tab} work"""
+    return self.__slots__
+
+  def __eq__(self, other) -> bool:
+
+    if not isinstance(other, Tab):
+      return NotImplemented
+
+    return (    self.id    == other.id
+            and self.title == other.title
+            and self.url   == other.url)
+
+  def __repr__(self) -> str:
+    return f"Tab({self.id!r}, {self.title!r}, {self.url!r})"
+
+class BrowserSession:
+  """connections to every bt-mediator, shared by all operations
+
+  Owns a pool of worker threads, through which the mediators are queried
+  in parallel.
+  Mediators which (re)appear are picked up by connect(),
+  which probes the mediator ports at most every PROBE_INTERVAL seconds.
+
+  Listing tabs gives each browser fetch_timeout seconds to answer.
+  Browsers which fail or take longer are left out, noted in failures;
+  a request still in flight is then awaited again by the next listing,
+  rather than repeated.
+  """
+
+  PROBE_INTERVAL = 10
+
+  def __init__(self, ports: Iterable[int] = None):
+    """connects to mediators on the given ports,
+       by default brotab's, as prefixes a, b, c... in order"""
+
+    from tab_wrangler.mediator import get_mediator_ports
+
+    self._ports = list(get_mediator_ports() if ports is None else ports)
+
+    self._clients: Dict[str, "MediatorConnection"] = {}
+
+    self._connecting: Dict[str, Future] = {} # prefix: MediatorConnection
+
+    self._listing: Dict[str, Future] = {} # prefix: tabs
+
+    self._lock = Lock() # for the three above
+
+    self.failures: Dict[str, str] = {} # prefix: why left out of last listing
+
+    self._probed_at = None
+
+    self._executor = ThreadPoolExecutor(thread_name_prefix="mediator")
+
+    self.connect()
+
+  @property
+  def clients(self) -> List["MediatorConnection"]:
+    with self._lock:
+      return [self._clients[prefix] for prefix in sorted(self._clients)]
+
+  def connect(self, force: bool = False) -> None:
+    """probes for new mediators, waiting up to fetch_timeout for them,
+       and picks up those which were too slow to answer before"""
+
+    from tab_wrangler.mediator import (MediatorConnection,
+                                       is_port_accepting_connections)
+
+    probing = {}
+
+    with self._lock:
+
+      if (   force
+          or self._probed_at is None
+          or monotonic() - self._probed_at >= self.PROBE_INTERVAL):
+
+        self._probed_at = monotonic()
+
+        for prefix, port in zip(ascii_lowercase, self._ports):
+
+          if (   f"{prefix}." in self._clients
+              or f"{prefix}." in self._connecting
+              or not is_port_accepting_connections(port)):
+            continue
+
+          # asks the mediator for its browser, which may hang
+          probing[f"{prefix}."] = self._executor.submit(MediatorConnection,
+                                                        prefix = prefix,
+                                                        port   = port)
+
+        self._connecting.update(probing)
+
+    if probing:
+      with span("connect", mediators=len(probing)):
+        wait(probing.values(), timeout=fetch_timeout)
+
+    with self._lock:
+
+      for prefix, future in list(self._connecting.items()):
+
+        if not future.done():
+          continue
+
+        del self._connecting[prefix]
+
+        if future.exception() is not None:
+          continue
+
+        client = future.result()
+
+        if client.ready:
+          self._clients[prefix] = client
+        else:
+          client.close()
+
+  def client(self, prefix: str) -> "MediatorConnection":
+    return self._clients.get(prefix)
+
+  def disconnect(self, client: "MediatorConnection") -> None:
+
+    with self._lock:
+      self._clients.pop(client.prefix, None)
+      self._listing.pop(client.prefix, None)
+
+    client.close()
+
+  def shutdown(self) -> None:
+
+    for client in self.clients:
+      self.disconnect(client)
+
+    self._executor.shutdown(wait=False)
+
+  def _call_parallel(self, functions: List[Callable]) -> list:
+    """calls functions in the session's worker threads,
+       returning their results or exceptions in order"""
+
+    futures = [self._executor.submit(function) for function in functions]
+
+    wait(futures)
+
+    return [future.result() if future.exception() is None
+            else future.exception()
+            for future in futures]
+
+  def list_tabs(self) -> List[str]:
+    """the tabs of every browser answering in time, noting the others
+       in failures"""
+
+    self.connect()
+
+    clients = self.clients
+
+    with self._lock:
+
+      for client in clients:
+        if client.prefix not in self._listing:
+          self._listing[client.prefix] = self._executor.submit(
+            client.list_tabs, [])
+
+      listing = {client.prefix: self._listing[client.prefix]
+                 for client in clients
+                 if client.prefix in self._listing}
+
+    wait(listing.values(), timeout=fetch_timeout)
+
+    with self._lock: # changed by connect() in other threads
+      failures = {prefix: "not answering yet" for prefix in self._connecting}
+
+    tabs = []
+
+    for client in clients:
+
+      future = listing.get(client.prefix)
+
+      if future is None: # disconnected meanwhile
+        continue
+
+      if not future.done():
+        failures[client.prefix] = f"{client.browser} timed out"
+        continue
+
+      with self._lock:
+        if self._listing.get(client.prefix) is future:
+          del self._listing[client.prefix]
+
+      error = future.exception()
+
+      if isinstance(error, URLError): # browser closed or mediator down
+        self.disconnect(client)
+        failures[client.prefix] = f"{client.browser} disconnected"
+
+      elif error is not None:
+        failures[client.prefix] = f"{client.browser}: {error}"
+
+      else:
+        tabs.extend(future.result())
+
+    self.failures = failures
+
+    return tabs
+
+  def get_active_tabs(self, prefix: str = None) -> List[List[str]]:
+    """ids of the active tab of each window, for each browser,
+       or only for the browser with the given prefix"""
+
+    clients = self.clients if prefix is None else [self._clients[prefix]]
+
+    results = self._call_parallel([partial(client.get_active_tabs, [])
+                                   for client in clients])
+
+    for result in results:
+      if isinstance(result, Exception):
+        raise result
+
+    return results
+
+  def close_tabs(self, tab_ids: List[str]) -> None:
+    """closes tabs, sending each mediator only its own browser's tabs"""
+
+    functions = []
+
+    for client in self.clients:
+      client_tab_ids = client.filter_tabs(tab_ids)
+      if client_tab_ids:
+        functions.append(partial(client.close_tabs, client_tab_ids))
+
+    for result in self._call_parallel(functions):
+      if isinstance(result, Exception):
+        raise result
+
+  def open_urls(self,
+                urls:      List[str],
+                prefix:    str,
+                window_id: int = None
+                ) -> None:
+
+    self._clients[prefix].open_urls(urls, window_id)
+
+_session = None
+
+def get_session() -> BrowserSession:
+
+  global _session
+
+  if _session is None:
+    _session = BrowserSession()
+
+  return _session
+
+def set_session(session: BrowserSession) -> None:
+  """replaces the shared session, e.g. by one for other ports"""
+
+  global _session
+
+  shutdown()
+
+  _session = session
+
+  snapshot.invalidate()
+
+def shutdown() -> None:
+
+  global _session
+
+  if _session is not None:
+    _session.shutdown()
+    _session = None
 
 def get_windows() -> Dict[str, List[Tab]]:
+  """the windows of tabs of every browser answering in time,
+     with those which did not noted in the session's failures"""
 
-  api = MultipleMediatorsAPI(create_clients())
+  session = get_session()
 
-  set_event_loop(new_event_loop())
+  with span("fetch"):
+    tabs = session.list_tabs()
 
-  tabs = api.list_tabs(args=[]) # FIXME catch TimeoutError
+  with span("parse", tabs=len(tabs)):
+    return _parse(tabs, session)
 
-  get_event_loop().close()
+def _parse(tabs:    List[str],
+           session: BrowserSession = None
+           ) -> Dict[str, List[Tab]]:
+  """windows of tabs from the lines listed by the mediators,
+     skipping lines of browsers which failed to list their tabs"""
 
   windows: dict[str, list[Tab]] = {}
 
@@ -52,88 +380,298 @@ def get_windows() -> Dict[str, List[Tab]]:
 
     tab_info = tab.split("\t")
 
+    identifier = tab_info[0]
+
+    if identifier.endswith("<ERROR>"): # e.g. ['b.<ERROR>'] after a crash
+      if session is None:
+        continue
+      prefix = identifier.split('.')[0] + '.'
+      client = session.client(prefix)
+      session.failures[prefix] = \
+        f"{client.browser if client else ''} could not list tabs".lstrip()
+      continue
+
+    if identifier.count('.') != 2: # not prefix.window.tab
+      continue
+
+    # interned, being kept as the id of a row, and repeated every refresh
+    window_id = intern(identifier.rsplit('.', maxsplit=1)[0])
+
+    if window_id not in windows:
+      windows[window_id] = []
+
+    # a rare page lacks a url (or even a title), e.g. ['a.85.10', 'It is'] for
+      # https://www.really-learn-english.com/it-is-vs-there-is.html
+    title, url = (tab_info[1:] + ['', ''])[:2]
+
+    if "💤 " in title: # discarded tab
+      title = title.replace("💤 ", '')
+
+    windows[window_id].append(Tab(identifier, title, url))
+
+  return windows
+
+class TabSnapshotCache:
+  """the last get_windows() result, reused until older than max_snapshot_age
+
+  Concurrent refresh requests share a single fetch,
+  unless the snapshot was invalidated after that fetch began,
+  in which case the fetch is made again rather than kept,
+  as it may list tabs closed meanwhile.
+
+  Once given a path by persist(), each changed snapshot is also saved there,
+  in the mediators' own tab-separated format,
+  so the next run can start from it while fetching a current one.
+  """
+
+  def __init__(self):
+
+    self._windows: Dict[str, List[Tab]] = None
+
+    self._path = None
+
+    self._save_lock = Lock()
+
+    self.stale = False # whether the snapshot was loaded rather than fetched
+
+    self._failures: Dict[str, str] = {}
+
+    self._fetched_at = None
+
+    self._epoch = 0 # incremented by invalidate()
+
+    self._fetching_epoch = None # epoch at which the fetch in flight began
+
+    self._error = None
+
+    self._condition = Condition(Lock())
+
+  @property
+  def windows(self) -> Dict[str, List[Tab]]:
+    """the cached snapshot, however old, or None if never fetched"""
+    return self._windows
+
+  def persist(self, path: str) -> None:
+    """saves snapshots to path from now on,
+       starting from the one saved there before, if any, as stale"""
+
+    self._path = path
+
     try:
+      with span("load snapshot"), open(path) as snapshot_file:
+        windows = _parse(snapshot_file.read().splitlines())
+    except OSError: # none saved yet
+      return
 
-      identifier = tab_info[0]
+    with self._condition:
+      if self._windows is None:
+        self._windows = windows
+        self.stale = True
 
-      window_id = identifier.rsplit('.', maxsplit=1)[0]
+  @property
+  def failures(self) -> Dict[str, str]:
+    """why browsers were left out of the cached snapshot, by prefix"""
+    return self._failures
 
-      if window_id not in windows:
-        windows[window_id] = []
+  @property
+  def age(self) -> float:
 
-      windows[window_id].append({"id":    tab_info[0],
-                                 "title": tab_info[1].replace("💤 ", ''),
-                                 "url":   tab_info[2]})
+    if self._fetched_at is None:
+      return float("inf")
 
-      # FIXME crash on browser closed or bt-mediator down
-        # File "/home/casey/tab_wrangler/browser.py", line 57, in get_windows
-          # "title": tab_info[1].replace("💤 ", ''),
-                   # ~~~~~~~~^^^
-      # IndexError: list index out of range
+    return monotonic() - self._fetched_at
 
-      # hmm, ran into a rare case where a tab lacked a url
-        # print(tab_info)
-        # ['a.85.10', 'It is']
-      # this page caused & reproducibly causes it:
-        # https://www.really-learn-english.com/it-is-vs-there-is.html
-      # a normal one looks like:
-        # ['a.85.17', 'There is...', 'https://learnenglishteens...']
-      # FIXME handle this!
+  def get(self, max_age: float = None) -> Dict[str, List[Tab]]:
 
-    except IndexError as error:
+    if max_age is None:
+      max_age = max_snapshot_age
 
-      if  len(tab_info) != 3:
+    with self._condition:
+      if self._windows is not None and self.age <= max_age:
+        return self._windows
 
-        with open("/tmp/debug", 'w') as debugging_log:
-          debugging_log.write(f"incorrect tab_info length {len(tab_info)}: "
-                              f"{tab_info}\n")
-        # after browser crash:
-          # incorrect tab_info length 1: ['b.<ERROR>']
+    return self.refresh()
 
-      raise error # TODO handle, don't crash
-        # display temporary error message
-        # try to reestablish connection on regain focus
+  def refresh(self) -> Dict[str, List[Tab]]:
 
-      # FIXME
-        # File "/home/casey/tab_wrangler/browser.py", line 57, in get_windows
-          # "title": tab_info[1].replace("💤 ", ''),
-          # IndexError: list index out of range
+    with self._condition:
 
-  return windows
+      while self._fetching_epoch is not None:
+
+        epoch = self._fetching_epoch
+
+        while self._fetching_epoch == epoch:
+          self._condition.wait()
+
+        if epoch == self._epoch: # joined a fetch which is still current
+          if self._error is not None:
+            raise self._error
+          return self._windows
+
+      self._fetching_epoch = self._epoch
+
+    while True:
+
+      windows, failures, error = None, None, None
+
+      try:
+        windows = get_windows()
+        failures = dict(get_session().failures)
+      except Exception as exception:
+        error = exception
+
+      with self._condition:
+
+        if error is None and self._fetching_epoch != self._epoch:
+          self._fetching_epoch = self._epoch # invalidated meanwhile: again
+          self._condition.notify_all() # for joiners to wait on this one
+          continue
+
+        previous = self._windows
+
+        if error is None:
+          self._windows = windows
+          self._failures = failures
+          self.stale = False
+          self._fetched_at = monotonic()
+
+        self._error = error
+
+        self._fetching_epoch = None
+
+        self._condition.notify_all()
+
+        break
+
+    if error is not None:
+      raise error
+
+    if self._path is not None and windows != previous:
+      self._save(windows)
+
+    return windows
+
+  def _save(self, windows: Dict[str, List[Tab]]) -> None:
+
+    lines = [f"{tab['id']}\t{tab['title']}\t{tab['url']}\n"
+             for tabs in windows.values()
+             for tab in tabs]
+
+    with self._save_lock, span("save snapshot"):
+
+      try:
+
+        makedirs(dirname(self._path), exist_ok=True)
+
+        with open(self._path + ".new", 'w') as snapshot_file:
+          snapshot_file.writelines(lines)
+
+        replace(self._path + ".new", self._path) # never leaving half a file
+
+      except OSError: # only a cache, so no reason to fail the refresh
+        pass
+
+  def invalidate(self) -> None:
+    """forces the next get() to refetch, e.g. after closing tabs"""
+
+    with self._condition:
+      self._epoch += 1
+      self._fetched_at = None
+
+snapshot = TabSnapshotCache()
 
 class Window(TypedDict):
   title: str
   tabs:  List[Tab]
 
+def close_tabs(tab_ids: List[str]) -> None:
+  """closes tabs with a single request per mediator
+
+  Any browser which would be left without tabs first gets an about:blank tab,
+  as closing a browser's last window would close the browser itself.
+  """
+
+  session = get_session()
+
+  open_tab_ids = [tab.split("\t", maxsplit=1)[0]
+                  for tab in session.list_tabs()]
+
+  closing = set(tab_ids)
+
+  for client in session.clients:
+
+    browser_tab_ids = client.filter_tabs(open_tab_ids)
+
+    if browser_tab_ids and closing.issuperset(browser_tab_ids):
+      session.open_urls(urls=["about:blank"], prefix=client.prefix)
+
+  try:
+    session.close_tabs(tab_ids)
+  finally:
+    snapshot.invalidate()
+
+def journal_windows(operation: str,
+                    windows:   List[Window],
+                    files:     List[Tuple[str, int, int, List[str]]] = ()
+            ) -> int:
+  """logs windows about to be closed, so that undo() can reopen them,
+     returning the operation's id in the journal"""
+
+  tabs: Dict[str, List[Tuple[str, str]]] = {}
+
+  for window in windows:
+    for tab in window["tabs"]:
+      tabs.setdefault(tab["id"].rsplit('.', maxsplit=1)[0], []).append(
+        (tab["title"], tab["url"]))
+
+  return get_journal().record(operation = operation,
+                              windows   = tabs,
+                              files     = files)
+
 def close(windows: List[Window]) -> Union[str, HTTPError]:
 
   tab_list = [tab["id"]
                     for window in windows
                     for tab in window["tabs"]]
 
-  api = MultipleMediatorsAPI(create_clients())
-
-  set_event_loop(new_event_loop())
+  if not tab_list:
+    return "nothing to close"
 
-  if len(tab_list) == len(api.list_tabs(args=[])):
-    api.open_urls(urls=["about:blank"], prefix="a.")
+  operation_id = journal_windows("close", windows)
 
   try:
-    api.close_tabs(tab_list)
+    close_tabs(tab_list)
   except HTTPError as http_error:
+    get_journal().mark_undone(operation_id) # or undo would reopen copies
     return http_error
 
-  get_event_loop().close()
-
   return (f"closed {len(windows)} window"
           + ("s " if len(windows) > 1 else ' ')
           + f"and {sum([len(window['tabs']) for window in windows])} tab"
           + ("s " if len(windows[0]['tabs']) > 1 else ' '))
 
+def close_duplicates(tabs: List[Tab]) -> Union[str, HTTPError]:
+  """closes tabs open on a URL also open in another tab, as found by
+     DuplicateIndex.extra_tabs(), leaving their windows otherwise as they are"""
+
+  operation_id = journal_windows("close duplicates",
+                                 [{"title": None, "tabs": tabs}])
+
+  try:
+    close_tabs([tab["id"] for tab in tabs])
+  except HTTPError as http_error:
+    get_journal().mark_undone(operation_id) # or undo would reopen copies
+    return http_error
+
+  return f"closed {len(tabs)} duplicate tab" + ("s" if len(tabs) != 1 else '')
+
 def save_and_close(windows: List[Window],
                    name:    str = None
                    ) -> Union[str, HTTPError]:
 
+  if not any(window["tabs"] for window in windows):
+    return "nothing to save"
+
   subfolder = folder
 
   if name is None:
@@ -148,34 +686,53 @@ def save_and_close(windows: List[Window],
     # i guess then subfolder stays folder and name does NOT become None
     # but the logic of what is going on here is not very clear... do better.
 
-  if not isdir(subfolder):
-    mkdir(subfolder)
+  makedirs(subfolder, exist_ok=True)
 
-  file_indices = [int(filename)
-                  for filename in listdir(subfolder)
-                  if match(r"^[0-9]+$", filename)]
+  archived_urls = get_urls()
 
-  if len(file_indices):
-    index = max(file_indices) + 1
+  saving_urls = set()
 
-  else:
-    index = 0
+  archived_count = 0
 
-  api = MultipleMediatorsAPI(create_clients())
+  skipped_bytes = 0
 
-  set_event_loop(new_event_loop())
+  files = [] # (path, size before, size after, URLs first archived), for undo
 
-  window_count = len(windows)
+  for window in windows:
 
-  for window_number, window in enumerate(windows):
+    lines = []
 
-    contents = "\n".join([f"{tab['title']}\t{tab['url']}"
-                          for tab in window["tabs"]
-                          if tab['url'] not in ignored_urls])
+    urls = []
 
-    if contents:
+    new_urls = []
+
+    for tab in window["tabs"]:
+
+      if tab['url'] in ignored_urls:
+        continue
+
+      line = f"{tab['title']}\t{tab['url']}"
+
+      if tab['url'] in saving_urls or tab['url'] in archived_urls:
+
+        archived_count += 1
+
+        if archive.skip_archived_urls:
+          skipped_bytes += len(line.encode()) + 1 # and newline
+          continue
+
+      else:
+        new_urls.append(tab['url'])
+
+      lines.append(line)
+
+      urls.append(tab['url'])
+
+      saving_urls.add(tab['url'])
 
-      # TODO prevent duplicates
+    contents = "\n".join(lines)
+
+    if contents:
 
       if window["title"] is not None:
         file_path = join(subfolder, window["title"])
@@ -184,40 +741,50 @@ def save_and_close(windows: List[Window],
         if len(windows) == 1 and name is not None:
           file_path = join(folder, name)
         else:
-          file_path = join(subfolder, f"{index:04}")
-          index += 1
+          file_path = join(subfolder, f"{allocate_index(subfolder):04}")
 
       appended = False
 
+      size = None
+
       if isfile(file_path):
         appended = True
+        size = getsize(file_path)
         contents = "\n" + contents
 
-      with open(file_path, 'a') as output:
-        # FIXME IsADirectoryError: [Errno 21] Is a directory:
-          # '/home/casey/urls-tab_wrangler/linkedin'
-        output.write(contents)
+      with span("write", path=relpath(file_path, folder), tabs=len(lines)):
 
-      with open("/tmp/debug", 'w') as debugging_log:
-        # TODO remove this block after hopefully figuring out the error below
-        debugging_log.write(f"{window_number}\n")
-        debugging_log.write(f"{window_count - 1}\n")
+        with open(file_path, 'a') as output:
+          # FIXME IsADirectoryError: [Errno 21] Is a directory:
+            # '/home/casey/urls-tab_wrangler/linkedin'
+          output.write(contents)
 
-    if (    window_number == window_count - 1
-        and len(api.list_tabs(args=[])) == len(window["tabs"])):
+        get_index().update_file(file_path)
 
-          api.open_urls(urls=["about:blank"], prefix="a.")
+        archived_urls.add(urls)
 
-          # TODO consider multiple browsers, different prefixes
+      files.append((relpath(file_path, folder),
+                    size,
+                    getsize(file_path),
+                    new_urls))
 
-    try:
-      # FIXME urllib.error.URLError:
-        # <urlopen error [Errno 99] Cannot assign requested address>
-      api.close_tabs([tab["id"] for tab in window["tabs"]])
-    except HTTPError as http_error:
-      return http_error
+  if archive.skip_archived_urls and archived_count:
+    archived_urls.record_skipped(tabs=archived_count, bytes=skipped_bytes)
+
+  operation_id = journal_windows("save", windows, files)
+
+  # only close tabs once every window has been written out
+  try:
+    close_tabs([tab["id"] for window in windows for tab in window["tabs"]])
+  except HTTPError as http_error:
+    get_journal().mark_undone(operation_id) # or undo would reopen copies
+    return http_error
 
-  get_event_loop().close()
+  archived_note = ''
+
+  if archived_count:
+    archived_note = (f" ({archived_count} already archived"
+                     + (", left out)" if archive.skip_archived_urls else ")"))
 
   if len(windows) == 1:
 
@@ -225,73 +792,271 @@ def save_and_close(windows: List[Window],
       return (f"window with {len(windows[0]['tabs'])} tab"
               + ("s " if len(windows[0]['tabs']) > 1 else ' ')
               + ("appended to " if appended else "saved as ")
-              + relpath(file_path, folder))
+              + relpath(file_path, folder)
+              + archived_note)
 
     else:
       return (f"window with {len(windows[0]['tabs'])} tab"
               + ("s " if len(windows[0]['tabs']) > 1 else ' ')
-              + "discarded")
+              + "discarded"
+              + archived_note)
 
   return (f"{len(windows)} windows "
           + f"and {sum([len(window['tabs']) for window in windows])} tabs "
-          + "saved and closed")
+          + "saved and closed"
+          + archived_note)
 
-def focus_window(window_id: str) -> None:
+def open_in_batches(urls:       Iterable[str],
+                    prefix:     str,
+                    window_id:  str = None,
+                    batch_size: int = None,
+                    interval:   float = None,
+                    progress:   Callable[[int], None] = None
+                    ) -> Tuple[int, str]:
+  """opens URLs in a browser a batch at a time,
+     returning how many were opened and the window they were opened in
 
-  target_browser, target_window_id = window_id.split('.')
+  URLs are taken from the iterable as they are opened,
+  batch_size (default restore_batch_size) at once
+  and at most one batch every interval (default restore_interval) seconds,
+  so that a browser isn't made to load hundreds of pages at once.
+  Without a window id, the first batch opens a new window
+  and the rest follow it there.
+  progress is called with the URLs opened so far, every batch.
+  """
 
-  api = MultipleMediatorsAPI(create_clients())
+  if batch_size is None:
+    batch_size = restore_batch_size
 
-  set_event_loop(new_event_loop())
+  if interval is None:
+    interval = restore_interval
 
-  for browser in api.get_active_tabs(args=[]):
-    # FIXME urllib.error.URLError: <urlopen error [Errno 99] Cannot assign requested address>
-      # just retry once?
+  session = get_session()
 
-    for id in browser:
+  client = session.client(prefix)
 
-      browser, window_id, tab_id = id.split('.')
+  urls = iter(urls)
 
-      if browser != target_browser:
-        break
+  opened = 0
+
+  next_batch_at = monotonic()
+
+  while True:
+
+    batch = list(islice(urls, batch_size))
+
+    if not batch:
+      break
+
+    sleep(max(0, next_batch_at - monotonic()))
+
+    next_batch_at = monotonic() + interval
+
+    with span("restore batch", tabs=len(batch)):
+
+      if window_id is None:
+        before = {line.split("\t", maxsplit=1)[0]
+                  for line in client.list_tabs([])}
+
+      session.open_urls(urls      = batch,
+                        prefix    = prefix,
+                        window_id = window_id)
+
+      if window_id is None: # find the new window, for the next batches
+        window_ids = Counter(tab_id.split('.')[1]
+                             for tab_id
+                             in (line.split("\t", maxsplit=1)[0]
+                                 for line in client.list_tabs([]))
+                             if tab_id not in before)
+        if window_ids:
+          window_id = window_ids.most_common(1)[0][0]
+
+    opened += len(batch)
+
+    if progress is not None:
+      progress(opened)
+
+  return opened, window_id
+
+def restore(path:       str,
+            prefix:     str,
+            window_id:  str = None,
+            batch_size: int = None,
+            interval:   float = None,
+            progress:   Callable[[int, int], None] = None
+            ) -> Union[str, HTTPError]:
+  """reopens the tabs saved in an archive file, as by open_in_batches,
+     reading the file as they are opened
+
+  progress is called with the tabs opened so far and the total, every batch.
+  """
+
+  total = count_tabs(path)
+
+  try:
+    opened, window_id = open_in_batches(
+      urls       = (url for title, url in iter_tabs(path) if url),
+      prefix     = prefix,
+      window_id  = window_id,
+      batch_size = batch_size,
+      interval   = interval,
+      progress   = None if progress is None
+                   else lambda opened: progress(opened, total))
+
+  except HTTPError as http_error:
+    return http_error
+
+  finally:
+    snapshot.invalidate()
+
+  return (f"{opened} tab" + ("s " if opened != 1 else ' ')
+          + f"restored from {relpath(path, folder)}"
+          + (f" into window {prefix}{window_id}"
+             if window_id is not None else ''))
+
+def undo(progress: Callable[[int, int], None] = None) -> Union[str, URLError]:
+  """reopens the windows of the last close or save not yet undone,
+     as by open_in_batches, and takes back what it appended to the archive
+
+  An archive file appended to again since is left as it is.
+  progress is called with the tabs reopened so far and the total, every batch.
+  If the browser fails partway, the tabs not yet reopened are journaled
+  as an operation of their own, in place of this one, for undoing next.
+  """
+
+  journal = get_journal()
+
+  operation = journal.last()
+
+  if operation is None:
+    return "nothing to undo"
+
+  session = get_session()
+
+  if not session.clients:
+    return "no browser to reopen the windows in"
+
+  total = sum(len(tabs) for tabs in operation["windows"].values())
+
+  reopened = 0
+
+  remaining = dict(operation["windows"]) # tabs not reopened yet, by window
+
+  try:
+
+    # still open if only some of its tabs were closed, as duplicates
+    open_window_ids = {tab.split("\t", maxsplit=1)[0].rsplit('.', maxsplit=1)[0]
+                       for tab in session.list_tabs()}
+
+    for window_id, tabs in operation["windows"].items():
+
+      prefix = window_id.split('.')[0] + '.'
+
+      if session.client(prefix) is None: # since gone: any other will do
+        prefix = session.clients[0].prefix
+
+      def window_progress(opened, window_id=window_id, tabs=tabs):
+
+        remaining[window_id] = tabs[opened:]
+
+        if progress is not None:
+          progress(reopened + opened, total)
+
+      opened, _ = open_in_batches(
+        urls      = [url for title, url in tabs],
+        prefix    = prefix,
+        window_id = window_id.split('.')[1] if window_id in open_window_ids
+                    else None,
+        progress  = window_progress)
+
+      del remaining[window_id]
+
+      reopened += opened
+
+  except (HTTPError, URLError) as error: # e.g. the browser closed
+
+    if sum(len(tabs) for tabs in remaining.values()) < total:
+      # so that undoing again doesn't reopen tabs twice
+      journal.record(operation = operation["operation"],
+                     windows   = {window_id: tabs
+                                  for window_id, tabs in remaining.items()
+                                  if tabs},
+                     files     = operation["files"])
+      journal.mark_undone(operation["id"])
+
+    return error
+
+  finally:
+    snapshot.invalidate()
+
+  # without URLs first archived if journaled before they were
+  kept = [path for path, size, appended_size, *new_urls
+          in reversed(operation["files"])
+          if not revert_append(path          = join(folder, path),
+                               size          = size,
+                               appended_size = appended_size,
+                               new_urls      = next(iter(new_urls), None))]
+
+  journal.mark_undone(operation["id"])
+
+  windows = len(operation["windows"])
+
+  return (f"undid {operation['operation']}: reopened {windows} window"
+          + ("s " if windows != 1 else ' ')
+          + f"and {reopened} tab" + ("s" if reopened != 1 else '')
+          + (f"; left {', '.join(kept)} as changed since" if kept else ''))
+
+def index_tabs(windows: Dict[str, List[Tab]]) -> Dict[str, Tab]:
+  """the tabs of a snapshot by tab id"""
+
+  return {tab["id"]: tab for tabs in windows.values() for tab in tabs}
+
+def focus_window(window_id: str, tabs: Dict[str, Tab] = None) -> None:
+  """focuses a browser window, found by the title of its active tab
 
-      if window_id == target_window_id:
+  The title is looked up in tabs (indexed by tab id, as by index_tabs),
+  by default those of the snapshot, so that only the window's browser
+  need be asked which of its tabs are active.
+  """
 
-        for tab in api.list_tabs(args=[]):
+  prefix = window_id.split('.')[0] + '.'
 
-          tab_id, tab_title, _ = tab.split("\t")
+  session = get_session()
 
-          if tab_id == id:
+  if session.client(prefix) is None:
+    return
 
-            # FIXME doesn't work if window title is non-unique
-            # FIXME doesn't work if window title contains an apostrophe
+  active_tab_id = None
 
-            if "'" in tab_title:
-              tab_title =  tab_title[:tab_title.index("'")]
+  for tab_id in session.get_active_tabs(prefix=prefix)[0]:
+    if tab_id.rsplit('.', maxsplit=1)[0] == window_id:
+      active_tab_id = tab_id
+      break
 
-            if '"' in tab_title:
-              tab_title =  tab_title.replace('"', '\\"')
+  if active_tab_id is None: # window since closed
+    return
 
-            # TODO yeah, i should really do away with the jq dependency and be able to handle apostrophes...
+  if tabs is None:
+    tabs = index_tabs(snapshot.get())
 
-            # TODO at least add back in: select(.type?=="con") 
+  if active_tab_id not in tabs: # tab opened since the snapshot
+    tabs = index_tabs(snapshot.refresh())
 
-            con_id = getoutput("swaymsg -t get_tree "
-                               "| jq '.. | objects | .nodes?[]? | "
-                               "select(.type? == \"con\") | "
-                               "select(.name? != null) | "
-                               f"select(.name? | startswith(\"{tab_title}\")) "
-                               "| .id?'")
+  if active_tab_id not in tabs:
+    return
 
-            if "\n" in con_id:
-              con_id = con_id.split("\n")[0] # FIXME temporary workaround cheat
+  from tab_wrangler.sway import get_sway
 
-            # TODO account for different browsers
+  sway = get_sway()
 
-            # TODO move sway stuff into its own module
+  # TODO how to reliably check if sway vs. x11, or neither?
+  if sway is None:
+    # from subprocess import run
+    # run(["wmctrl", "a", f"{tabs[active_tab_id]['title']}"]) # iirc... TODO double-check
+    return
 
-            # TODO how to reliably check if sway vs. x11, or neither?
-            run(["swaymsg", f"[con_id={con_id}]", "focus"])
-            # run(["wmctrl", "a", f"{tab_title}"]) # iirc... TODO double-check
+  con_id = sway.find_window(title = tabs[active_tab_id]["title"],
+                            app   = session.client(prefix).browser)
 
-  get_event_loop().close()
+  if con_id is not None:
+    sway.focus(con_id)
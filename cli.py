@@ -0,0 +1,366 @@
+#!/bin/env python
+
+# non-interactive commands, for scripts and cron, e.g.:
+#   python -m tab_wrangler list --format jsonl
+#   python -m tab_wrangler save --all
+# never imports urwid
+
+from argparse import ArgumentParser
+from json import dumps
+from os import O_WRONLY, devnull, dup2
+from os import open as open_file
+from os.path import join
+from sys import stderr, stdout
+from typing import Dict, List
+
+from urllib.error import URLError
+
+from tab_wrangler import archive, browser, journal
+from tab_wrangler.domains import DomainIndex
+from tab_wrangler.duplicates import DuplicateIndex
+
+
+def write(record: dict, format: str) -> None:
+  """writes a record to stdout as a line of JSON or of tab-separated values"""
+
+  if format == "jsonl":
+    stdout.write(dumps(record, ensure_ascii=False) + "\n")
+  else:
+    stdout.write("\t".join(str(value) for value in record.values()) + "\n")
+
+def get_windows() -> Dict[str, List[browser.Tab]]:
+  """the windows of every browser, warning about those which failed"""
+
+  windows = browser.get_windows()
+
+  for prefix, reason in sorted(browser.get_session().failures.items()):
+    print(f"warning: {prefix} {reason}", file=stderr)
+
+  return windows
+
+def select_windows(arguments) -> List[browser.Window]:
+  """the windows given, or the tabs of each site given as a window titled
+     by the site, so as to be saved to a file named after it"""
+
+  if [arguments.all,
+      bool(arguments.windows),
+      bool(arguments.site)].count(True) != 1:
+    raise SystemExit("error: give either window ids, --all or --site")
+
+  windows = get_windows()
+
+  if arguments.site:
+
+    index = DomainIndex()
+
+    index.update(windows)
+
+    missing = [site for site in arguments.site if not index.tabs(site)]
+
+    if missing:
+      raise SystemExit(f"error: no tabs open on: {', '.join(missing)}")
+
+    return [{"title": site, "tabs": index.tabs(site)}
+            for site in arguments.site]
+
+  if arguments.all:
+
+    window_ids = list(windows)
+
+    if not window_ids:
+      raise SystemExit("error: no windows open")
+
+  else:
+
+    window_ids = arguments.windows
+
+    missing = [window_id for window_id in window_ids
+               if window_id not in windows]
+
+    if missing:
+      raise SystemExit(f"error: no such window: {', '.join(missing)}")
+
+  return [{"title": None, "tabs": windows[window_id]}
+          for window_id in window_ids]
+
+def list_tabs(arguments) -> int:
+
+  for window_id, tabs in get_windows().items():
+    for tab in tabs:
+      write({"window": window_id, **tab}, arguments.format)
+
+  return 0
+
+def sites(arguments) -> int:
+
+  index = DomainIndex()
+
+  index.update(get_windows())
+
+  for site, tab_count, window_count in index.domains():
+    write({"site": site, "tabs": tab_count, "windows": window_count},
+          arguments.format)
+
+  return 0
+
+def duplicates(arguments) -> int:
+
+  index = DuplicateIndex()
+
+  index.update(get_windows())
+
+  tabs = index.extra_tabs()
+
+  if arguments.close:
+    if not tabs:
+      return report("no duplicate tabs", arguments.format)
+    return report(browser.close_duplicates(tabs = tabs), arguments.format)
+
+  for tab in tabs:
+    write({"window": tab["id"].rsplit('.', maxsplit=1)[0], **tab},
+          arguments.format)
+
+  return 0
+
+def save(arguments) -> int:
+  return report(browser.save_and_close(windows = select_windows(arguments),
+                                       name    = arguments.name),
+                arguments.format)
+
+def close(arguments) -> int:
+  return report(browser.close(windows = select_windows(arguments)),
+                arguments.format)
+
+def report(status, format: str) -> int:
+
+  if isinstance(status, URLError): # or HTTPError, a kind of URLError
+    print(f"error: {status}", file=stderr)
+    return 1
+
+  write({"status": status.strip()}, format)
+
+  return 0
+
+def search(arguments) -> int:
+
+  query = ' '.join(arguments.query)
+
+  if arguments.archive:
+
+    for path, match_count in archive.get_index().search(query):
+      write({"path": path, "matches": match_count}, arguments.format)
+
+    return 0
+
+  query = query.casefold()
+
+  for window_id, tabs in get_windows().items():
+    for tab in tabs:
+      if query in tab["title"].casefold() or query in tab["url"].casefold():
+        write({"window": window_id, **tab}, arguments.format)
+
+  return 0
+
+def restore(arguments) -> int:
+
+  session = browser.get_session()
+
+  window_id = None
+
+  if arguments.window is not None: # e.g. a.85
+    prefix, _, window_id = arguments.window.rpartition('.')
+    prefix += '.'
+  elif arguments.browser is not None:
+    prefix = arguments.browser.rstrip('.') + '.'
+  elif session.clients:
+    prefix = session.clients[0].prefix
+  else:
+    prefix = None
+
+  if session.client(prefix) is None:
+    print(f"error: no browser {prefix or 'connected'}", file=stderr)
+    return 1
+
+  def progress(opened: int, total: int) -> None:
+    if stderr.isatty():
+      print(f"\r{opened}/{total} tabs", end='', file=stderr, flush=True)
+
+  status = browser.restore(path       = join(archive.folder, arguments.path),
+                           prefix     = prefix,
+                           window_id  = window_id,
+                           batch_size = arguments.batch_size,
+                           interval   = arguments.interval,
+                           progress   = progress)
+
+  if stderr.isatty():
+    print(file=stderr)
+
+  return report(status, arguments.format)
+
+def undo(arguments) -> int:
+
+  def progress(opened: int, total: int) -> None:
+    if stderr.isatty():
+      print(f"\r{opened}/{total} tabs", end='', file=stderr, flush=True)
+
+  for number in range(arguments.count):
+
+    if number and journal.get_journal().last() is None:
+      break # with nothing left to undo
+
+    status = browser.undo(progress=progress)
+
+    if stderr.isatty():
+      print(file=stderr)
+
+    if report(status, arguments.format):
+      return 1
+
+  return 0
+
+def parser() -> ArgumentParser:
+
+  parser = ArgumentParser(prog        = "python -m tab_wrangler",
+                          description = "without a command, "
+                                        "starts the interactive interface")
+
+  output = ArgumentParser(add_help=False)
+
+  output.add_argument("--format",
+                      choices = ["tsv", "jsonl"],
+                      default = "tsv",
+                      help    = "output format (default: %(default)s)")
+
+  commands = parser.add_subparsers(title="commands", required=True)
+
+  command = commands.add_parser("list",
+                                parents = [output],
+                                help    = "list every open tab")
+
+  command.set_defaults(function=list_tabs)
+
+  command = commands.add_parser("sites",
+                                parents = [output],
+                                help    = "list the sites of open tabs, "
+                                          "with their tab and window counts")
+
+  command.set_defaults(function=sites)
+
+  command = commands.add_parser("duplicates",
+                                parents = [output],
+                                help    = "list tabs open on a URL "
+                                          "already open in an earlier tab")
+
+  command.set_defaults(function=duplicates)
+
+  command.add_argument("--close",
+                       action = "store_true",
+                       help   = "close them instead, "
+                                "leaving one tab open on each URL")
+
+  for name, function, help in [("save",  save,  "save and close windows"),
+                               ("close", close, "close windows")]:
+
+    command = commands.add_parser(name, parents=[output], help=help)
+
+    command.set_defaults(function=function)
+
+    command.add_argument("windows",
+                         nargs   = '*',
+                         metavar = "WINDOW",
+                         help    = "window id, as listed, e.g. a.85")
+
+    command.add_argument("--all",
+                         action  = "store_true",
+                         help    = "every window of every browser")
+
+    command.add_argument("--site",
+                         action  = "append",
+                         help    = "every tab on a site, e.g. github.com, "
+                                   "in any window (repeatable)")
+
+    if name == "save":
+      command.add_argument("--name",
+                           help    = "file (or, for several windows, folder) "
+                                     "to save to, instead of untitled")
+
+  command = commands.add_parser("search",
+                                parents = [output],
+                                help    = "list open tabs whose title or URL "
+                                          "contains the query")
+
+  command.set_defaults(function=search)
+
+  command.add_argument("query", nargs='+')
+
+  command.add_argument("--archive",
+                       action = "store_true",
+                       help   = "search saved windows instead, "
+                                "listing files and matching tab counts")
+
+  command = commands.add_parser("restore",
+                                parents = [output],
+                                help    = "reopen the tabs of a saved window")
+
+  command.set_defaults(function=restore)
+
+  command.add_argument("path",
+                       help    = "file, relative to the archive folder")
+
+  command.add_argument("--browser",
+                       help    = "prefix of the browser to open a new window "
+                                 "in, e.g. b. (default: the first)")
+
+  command.add_argument("--window",
+                       help    = "window id, as listed, to open the tabs in "
+                                 "instead of a new window")
+
+  command.add_argument("--batch-size",
+                       type    = int,
+                       help    = "tabs to open at once (default: "
+                                 f"{browser.restore_batch_size})")
+
+  command.add_argument("--interval",
+                       type    = float,
+                       help    = "seconds between batches (default: "
+                                 f"{browser.restore_interval})")
+
+  command = commands.add_parser("undo",
+                                parents = [output],
+                                help    = "reopen the windows of the last "
+                                          "close or save, taking back "
+                                          "what it saved")
+
+  command.set_defaults(function=undo)
+
+  command.add_argument("count",
+                       nargs   = '?',
+                       type    = int,
+                       default = 1,
+                       help    = "operations to undo (default: %(default)s)")
+
+  return parser
+
+def main(arguments: List[str] = None) -> int:
+
+  arguments = parser().parse_args(arguments)
+
+  try:
+    return arguments.function(arguments)
+
+  except URLError as error:
+    print(f"error: {error.reason}", file=stderr)
+    return 1
+
+  except BrokenPipeError: # e.g. piped into head
+    dup2(open_file(devnull, O_WRONLY), stdout.fileno()) # nothing left to flush
+    return 0
+
+  except OSError as error: # e.g. no such saved window
+    print(f"error: {error}", file=stderr)
+    return 1
+
+  finally:
+    browser.shutdown()
+    archive.close_archive()
+    journal.close_journal()
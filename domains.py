@@ -0,0 +1,112 @@
+#!/bin/env python
+
+from typing import Dict, List, Set, Tuple
+
+from tab_wrangler.browser import Tab
+
+
+def domain(url: str) -> str:
+  """the host of a URL, without any leading www.,
+     or its scheme for one without a host, e.g. about: or file:"""
+
+  scheme, separator, rest = url.partition("://")
+
+  if not separator:
+    return url.partition(':')[0].casefold() + ':'
+
+  host = rest
+
+  for end in "/?#":
+    host = host.partition(end)[0]
+
+  host = host.rpartition('@')[2] # no user or password
+
+  if host.startswith('['): # IPv6
+    host = host.partition(']')[0] + ']'
+  else:
+    host = host.partition(':')[0] # no port
+
+  host = host.casefold()
+
+  if host.startswith("www."):
+    host = host[len("www."):]
+
+  return host or scheme.casefold() + ':'
+
+class DomainIndex:
+  """the tabs of a snapshot by site, for acting on them across windows
+
+  Brought up to date with a snapshot window by window,
+  looking again only at windows whose URLs changed since the last one.
+  """
+
+  def __init__(self):
+
+    self._urls: Dict[str, List[str]] = {} # of each window, as last indexed
+
+    self._domains: Dict[str, Set[str]] = {} # of each window
+
+    # domain: window id: positions of the window's tabs on that domain
+    self._positions: Dict[str, Dict[str, List[int]]] = {}
+
+    self._windows: Dict[str, List[Tab]] = {}
+
+  def update(self, windows: Dict[str, List[Tab]]) -> None:
+
+    for window_id in self._urls.keys() - windows.keys():
+      self._remove(window_id)
+
+    for window_id, tabs in windows.items():
+
+      urls = [tab["url"] for tab in tabs]
+
+      if self._urls.get(window_id) == urls:
+        continue
+
+      if window_id in self._urls:
+        self._remove(window_id)
+
+      self._urls[window_id] = urls
+
+      positions: Dict[str, List[int]] = {}
+
+      for position, url in enumerate(urls):
+        positions.setdefault(domain(url), []).append(position)
+
+      self._domains[window_id] = set(positions)
+
+      for url_domain, domain_positions in positions.items():
+        self._positions.setdefault(url_domain, {})[window_id] = domain_positions
+
+    self._windows = windows
+
+  def _remove(self, window_id: str) -> None:
+
+    del self._urls[window_id]
+
+    for url_domain in self._domains.pop(window_id):
+
+      del self._positions[url_domain][window_id]
+
+      if not self._positions[url_domain]:
+        del self._positions[url_domain]
+
+  def domains(self) -> List[Tuple[str, int, int]]:
+    """(domain, tab count, window count) of every domain, most tabs first"""
+
+    counts = [(url_domain,
+               sum(len(positions) for positions in windows.values()),
+               len(windows))
+              for url_domain, windows in self._positions.items()]
+
+    counts.sort(key=lambda count: (-count[1], count[0]))
+
+    return counts
+
+  def tabs(self, url_domain: str) -> List[Tab]:
+    """the tabs on a domain, window by window"""
+
+    return [self._windows[window_id][position]
+            for window_id, positions
+            in self._positions.get(url_domain, {}).items()
+            for position in positions]
@@ -0,0 +1,133 @@
+#!/bin/env python
+
+from typing import Dict, List, Set, Tuple
+
+from tab_wrangler.browser import Tab
+
+
+default_ports = {"http": ":80", "https": ":443"}
+
+def normalize(url: str) -> str:
+  """a URL as compared for duplicates: without tracking parameters,
+     default port or a trailing slash,
+     and with its scheme and host in lower case
+
+  The fragment is kept, as many apps route by it (e.g. Gmail's #inbox
+  and #sent), and a fragment may not mean the same page at all.
+  """
+
+  url, hash, fragment = url.partition('#')
+
+  scheme, separator, rest = url.partition("://")
+
+  if not separator: # e.g. about:blank
+    return url + hash + fragment
+
+  scheme = scheme.casefold()
+
+  host, slash, path = rest.partition('/')
+
+  host = host.casefold()
+
+  if host.endswith(default_ports.get(scheme, "\0")):
+    host = host[:-len(default_ports[scheme])]
+
+  if "utm_" in path:
+    path, question_mark, query = path.partition('?')
+    query = '&'.join(parameter for parameter in query.split('&')
+                     if not parameter.startswith("utm_"))
+    path += '?' + query if query else ''
+
+  return f"{scheme}://{host}/{path.rstrip('/')}{hash}{fragment}"
+
+class DuplicateIndex:
+  """the tabs of a snapshot by normalized URL, to find tabs open more than once
+
+  Brought up to date with each snapshot window by window,
+  looking again only at windows whose URLs changed since the last one.
+  """
+
+  def __init__(self):
+
+    self._urls: Dict[str, List[str]] = {} # of each window, as last indexed
+
+    self._normalized: Dict[str, Set[str]] = {} # those URLs, normalized
+
+    # normalized URL: (window id, position) of each tab open on it
+    self._copies: Dict[str, List[Tuple[str, int]]] = {}
+
+    self._windows: Dict[str, List[Tab]] = {}
+
+    self.count = 0 # tabs beyond the first open on each URL
+
+  def update(self, windows: Dict[str, List[Tab]]) -> None:
+
+    for window_id in self._urls.keys() - windows.keys():
+      self._remove(window_id)
+
+    for window_id, tabs in windows.items():
+
+      urls = [tab["url"] for tab in tabs]
+
+      if self._urls.get(window_id) == urls:
+        continue
+
+      if window_id in self._urls:
+        self._remove(window_id)
+
+      self._urls[window_id] = urls
+
+      normalized_urls = self._normalized[window_id] = set()
+
+      for position, url in enumerate(urls):
+
+        normalized = normalize(url)
+
+        normalized_urls.add(normalized)
+
+        copies = self._copies.setdefault(normalized, [])
+
+        if copies:
+          self.count += 1
+
+        copies.append((window_id, position))
+
+    self._windows = windows
+
+  def _remove(self, window_id: str) -> None:
+
+    del self._urls[window_id]
+
+    for normalized in self._normalized.pop(window_id):
+
+      copies = self._copies[normalized]
+
+      kept = [copy for copy in copies if copy[0] != window_id]
+
+      self.count -= len(copies) - max(len(kept), 1)
+
+      if kept:
+        self._copies[normalized] = kept
+      else:
+        del self._copies[normalized]
+
+  def copies(self, url: str) -> int:
+    """how many tabs are open on a URL, once normalized"""
+
+    return len(self._copies.get(normalize(url), ()))
+
+  def extra_tabs(self) -> List[Tab]:
+    """every tab but the first (in window order) open on each URL"""
+
+    order = {window_id: number for number, window_id
+             in enumerate(self._windows)}
+
+    extra = []
+
+    for copies in self._copies.values():
+      if len(copies) > 1:
+        copies = sorted(copies, key=lambda copy: (order[copy[0]], copy[1]))
+        extra.extend(self._windows[window_id][position]
+                     for window_id, position in copies[1:])
+
+    return extra
@@ -0,0 +1,296 @@
+#!/bin/env python
+
+# checks of the Sway IPC client against a stand-in window manager, e.g.:
+#   python -m tab_wrangler.fake_sway
+# needs neither Sway nor i3, nor a browser
+
+from json import dumps
+from os.path import join
+from socket import AF_UNIX, MSG_WAITALL, SOCK_STREAM, socket
+from sys import getswitchinterval, setswitchinterval
+from tempfile import TemporaryDirectory
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Callable, Dict, List, Tuple
+
+from tab_wrangler.sway import (GET_TREE,
+                               RUN_COMMAND,
+                               SUBSCRIBE,
+                               WINDOW_EVENT,
+                               Sway,
+                               _header,
+                               _send)
+
+
+class FakeSway:
+  """a UNIX socket server answering like Sway's IPC
+
+  Serves a tree of windows (con_id: (title, app_id)),
+  focuses them on [con_id=N] focus commands,
+  and sends window events to subscribers as windows are opened,
+  renamed or closed through its methods.
+  """
+
+  def __init__(self, path: str, windows: Dict[int, Tuple[str, str]]):
+
+    self._windows = dict(windows)
+
+    self._lock = Lock()
+
+    self._subscribers: List[socket] = []
+
+    self.focused: int = None
+
+    self._server = socket(AF_UNIX, SOCK_STREAM)
+
+    self._server.bind(path)
+
+    self._server.listen()
+
+    Thread(target = self._accept,
+           name   = "fake sway",
+           daemon = True).start()
+
+  def open(self, con_id: int, title: str, app: str) -> None:
+
+    with self._lock:
+      self._windows[con_id] = (title, app)
+
+    self._emit("new", con_id, title, app)
+
+  def rename(self, con_id: int, title: str) -> None:
+
+    with self._lock:
+      app = self._windows[con_id][1]
+      self._windows[con_id] = (title, app)
+
+    self._emit("title", con_id, title, app)
+
+  def close(self, con_id: int) -> None:
+
+    with self._lock:
+      title, app = self._windows.pop(con_id)
+
+    self._emit("close", con_id, title, app)
+
+  def drop_subscribers(self) -> None:
+    """closes the event connections, as if Sway had restarted"""
+
+    with self._lock:
+      for subscriber in self._subscribers:
+        subscriber.close()
+      self._subscribers = []
+
+  def stop(self) -> None:
+    self.drop_subscribers()
+    self._server.close()
+
+  def _emit(self, change: str, con_id: int, title: str, app: str) -> None:
+
+    event = dumps({"change":    change,
+                   "container": {"id":     con_id,
+                                 "type":   "con",
+                                 "name":   title,
+                                 "app_id": app}})
+
+    with self._lock:
+      for subscriber in self._subscribers:
+        _send(subscriber, WINDOW_EVENT, event)
+
+  def _accept(self) -> None:
+
+    while True:
+
+      try:
+        connection, _ = self._server.accept()
+      except OSError: # stopped
+        return
+
+      Thread(target = self._serve,
+             args   = (connection,),
+             daemon = True).start()
+
+  def _serve(self, connection: socket) -> None:
+
+    try:
+      while True:
+
+        message_type, payload = self._receive(connection)
+
+        if message_type == GET_TREE:
+          _send(connection, GET_TREE, dumps(self._tree()))
+
+        elif message_type == RUN_COMMAND:
+          _send(connection, RUN_COMMAND, dumps([self._command(payload)]))
+
+        elif message_type == SUBSCRIBE:
+          with self._lock:
+            _send(connection, SUBSCRIBE, dumps({"success": True}))
+            self._subscribers.append(connection)
+          return # only events from now on
+
+    except OSError:
+      connection.close()
+
+  def _receive(self, connection: socket) -> Tuple[int, str]:
+    """a request, whose payload isn't always JSON, unlike replies"""
+
+    header = connection.recv(_header.size, MSG_WAITALL)
+
+    if len(header) < _header.size:
+      raise OSError("connection closed")
+
+    _, length, message_type = _header.unpack(header)
+
+    payload = connection.recv(length, MSG_WAITALL) if length else b''
+
+    return message_type, payload.decode()
+
+  def _tree(self) -> dict:
+
+    with self._lock:
+      windows = [{"id": con_id, "type": "con", "name": title, "app_id": app}
+                 for con_id, (title, app) in self._windows.items()]
+
+    return {"id": 1, "type": "root", "nodes": [
+             {"id": 2, "type": "output", "nodes": [
+               {"id": 3, "type": "workspace", "nodes": windows}]}]}
+
+  def _command(self, command: str) -> dict:
+
+    criteria, _, action = command.partition("] ")
+
+    con_id = int(criteria.partition("con_id=")[2])
+
+    with self._lock:
+
+      if action != "focus" or con_id not in self._windows:
+        return {"success": False, "error": "No matching node."}
+
+      self.focused = con_id
+
+    return {"success": True}
+
+def wait_for(condition: Callable[[], bool], timeout: float = 2) -> bool:
+
+  deadline = monotonic() + timeout
+
+  while not condition():
+    if monotonic() > deadline:
+      return False
+    sleep(0.01)
+
+  return True
+
+def check(name: str, passed: bool) -> bool:
+
+  print(("ok   " if passed else "FAIL ") + name)
+
+  return passed
+
+def main() -> int:
+
+  results = []
+
+  with TemporaryDirectory(prefix="tab_wrangler-sway-") as folder:
+
+    path = join(folder, "ipc.sock")
+
+    fake = FakeSway(path, {10: ("notes - Mozilla Firefox", "firefox"),
+                           11: ("notes", "chromium"),
+                           12: ("notes - Chromium", "chromium")})
+
+    sway = Sway(path)
+
+    results.append(check("find_window prefers an exact title",
+                         sway.find_window("notes") == 11))
+
+    results.append(check("find_window prefers the app among prefixes",
+                         sway.find_window("notes - ", app="firefox") == 10))
+
+    results.append(check("find_window finds nothing for an unknown title",
+                         sway.find_window("mail") is None))
+
+    results.append(check("focus focuses the window",
+                         sway.focus(12) and fake.focused == 12))
+
+    results.append(check("focus fails for a window since closed",
+                         not sway.focus(99)))
+
+    fake.open(13, "mail - Mozilla Firefox", "firefox")
+
+    results.append(check("a new window's event adds it",
+                         wait_for(lambda: sway.find_window("mail") == 13)))
+
+    fake.rename(13, "inbox - Mozilla Firefox")
+
+    results.append(check("a title event renames it",
+                         wait_for(lambda: sway.find_window("inbox") == 13)))
+
+    fake.close(13)
+
+    results.append(check("a close event removes it",
+                         wait_for(lambda: sway.find_window("inbox") is None)))
+
+    churning = True
+
+    def churn():
+
+      con_id = 100
+
+      while churning:
+
+        fake.open(con_id, f"window {con_id}", "firefox")
+
+        if con_id > 100:
+          fake.close(con_id - 1)
+
+        con_id += 1
+
+    for con_id in range(1000, 3000): # so that finding takes a while
+      fake.open(con_id, f"other {con_id}", "firefox")
+
+    wait_for(lambda: sway.find_window("other 2999") == 2999)
+
+    switch_interval = getswitchinterval()
+
+    setswitchinterval(1e-6) # switching threads mid-iteration, if unguarded
+
+    churner = Thread(target=churn, daemon=True)
+
+    churner.start()
+
+    try:
+      for _ in range(500):
+        sway.find_window("notes")
+      survived = True
+    except RuntimeError: # dictionary changed size during iteration
+      survived = False
+
+    churning = False
+
+    churner.join()
+
+    setswitchinterval(switch_interval)
+
+    results.append(check("find_window survives windows opening and closing",
+                         survived))
+
+    fake.drop_subscribers()
+
+    results.append(check("without events, the tree is fetched every time",
+                         wait_for(lambda: not sway._following)))
+
+    fake.open(14, "late", "firefox")
+
+    results.append(check("and still finds new windows",
+                         sway.find_window("late") == 14))
+
+    sway.close()
+
+    fake.stop()
+
+  return 0 if all(results) else 1
+
+if __name__ == "__main__":
+  raise SystemExit(main())
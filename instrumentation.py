@@ -0,0 +1,127 @@
+#!/bin/env python
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from json import dumps
+from os import environ
+from threading import Lock, current_thread
+from time import perf_counter, time
+from typing import Deque, Dict, Iterator, List, Tuple
+
+
+# set to a file path to append every span to it as a line of JSON
+trace_path = environ.get("TAB_WRANGLER_TRACE")
+
+histogram_bounds = [0.001, 0.002, 0.004, 0.008, 0.016, 0.032, 0.064,
+                    0.128, 0.256, 0.512, 1.024] # seconds
+
+class Latencies:
+  """the most recent durations of one kind of span"""
+
+  def __init__(self, size: int = 1000):
+    self._samples: Deque[float] = deque(maxlen=size)
+
+  def __len__(self):
+    return len(self._samples)
+
+  def add(self, duration: float) -> None:
+    self._samples.append(duration)
+
+  @property
+  def last(self) -> float:
+    return self._samples[-1] if self._samples else None
+
+  def percentile(self, percent: float) -> float:
+    """the nearest-rank percentile, or None if nothing was recorded"""
+
+    if not self._samples:
+      return None
+
+    samples = sorted(self._samples)
+
+    return samples[min(len(samples) - 1,
+                       max(0, round(percent / 100 * len(samples)) - 1))]
+
+  def histogram(self) -> List[Tuple[float, int]]:
+    """(upper bound, count) of the durations within each histogram bound,
+       with an infinite bound for the rest"""
+
+    counts = [0] * (len(histogram_bounds) + 1)
+
+    for duration in self._samples:
+      for index, bound in enumerate(histogram_bounds):
+        if duration < bound:
+          break
+      else:
+        index = len(histogram_bounds)
+      counts[index] += 1
+
+    return list(zip(histogram_bounds + [float("inf")], counts))
+
+latencies: Dict[str, Latencies] = defaultdict(Latencies)
+
+_lock = Lock()
+
+_trace_file = None
+
+@contextmanager
+def span(name: str, **fields) -> Iterator[dict]:
+  """times the enclosed block, kept in latencies[name] and traced if enabled
+
+  Yields the span's fields, to which the block may add.
+  """
+
+  started_at = time()
+
+  start = perf_counter()
+
+  try:
+    yield fields
+
+  except BaseException as error:
+    fields["error"] = type(error).__name__
+    raise
+
+  finally:
+
+    duration = perf_counter() - start
+
+    with _lock:
+
+      latencies[name].add(duration)
+
+      if trace_path is not None:
+        _trace({"span":     name,
+                "start":    started_at,
+                "duration": duration,
+                "thread":   current_thread().name,
+                **fields})
+
+def _trace(record: dict) -> None:
+  """appends a record to the trace file, called holding _lock"""
+
+  global _trace_file
+
+  if _trace_file is None:
+    _trace_file = open(trace_path, 'a', buffering=1) # line buffered
+
+  _trace_file.write(dumps(record, default=str) + "\n")
+
+def close_trace() -> None:
+
+  global _trace_file
+
+  with _lock:
+    if _trace_file is not None:
+      _trace_file.close()
+      _trace_file = None
+
+def milliseconds(duration: float) -> str:
+
+  if duration is None:
+    return '-'
+
+  if duration < 0.01:
+    return f"{duration * 1000:.2g}ms"
+
+  return f"{duration * 1000:.0f}ms"
@@ -0,0 +1,203 @@
+#!/bin/env python
+
+from json import dumps, loads
+from os import fsync, makedirs, replace
+from os.path import dirname, getsize, isfile, join
+from threading import Lock
+from time import monotonic, time
+from typing import Dict, List, Tuple
+
+from tab_wrangler.archive import folder
+
+
+fsync_interval = 5 # seconds between forcing the journal out to disk
+
+max_size = 1 << 20 # bytes the journal may grow to before being compacted
+
+compacted_size = max_size // 2 # bytes of the latest operations kept then
+
+class Journal:
+  """an append-only log of closed windows, for undoing closes and saves
+
+  Each close or save is a line of JSON, written before any tab is closed:
+  the windows' tabs, and the archive files appended to with their sizes
+  before and after (and the URLs archived for the first time),
+  so that the appends can be taken back.
+  The file is flushed after every line, but fsynced at most once every
+  fsync_interval seconds (and when closed), so saving never waits on the disk.
+  Undoing an operation appends a line saying so.
+  Once the file outgrows max_size, it is rewritten with only the latest
+  operations not undone that fit in compacted_size (at least the last),
+  so that it is rewritten once every few saves at most, however large.
+  """
+
+  def __init__(self, path: str = join(folder, ".journal")):
+
+    self._lock = Lock()
+
+    self._path = path
+
+    self._file = None
+
+    self._synced_at = monotonic()
+
+    self._operations: Dict[int, dict] = {} # not undone, by id, oldest first
+
+    self._next_id = 0
+
+    self._torn = False # last line cut short, to be ended before appending
+
+    if isfile(path):
+      self._load()
+
+  def _load(self) -> None:
+
+    with open(self._path, encoding="utf8") as journal_file:
+      for line in journal_file:
+
+        self._torn = not line.endswith("\n")
+
+        try:
+          record = loads(line)
+        except ValueError: # torn by a crash while being written
+          continue
+
+        if "undone" in record:
+          self._operations.pop(record["undone"], None)
+        else:
+          self._operations[record["id"]] = record
+          self._next_id = max(self._next_id, record["id"] + 1)
+
+    if getsize(self._path) > max_size:
+      self._compact()
+
+  def record(self,
+             operation: str,
+             windows:   Dict[str, List[Tuple[str, str]]],
+             files:     List[Tuple[str, int, int, List[str]]] = ()
+             ) -> int:
+    """logs an operation about to close windows, returning its id
+
+    windows: (title, url) of each tab, by window id
+    files: (path relative to the archive folder, size before, size after,
+            URLs archived for the first time) of each archive file
+           appended to, the size before being None for a file created
+    """
+
+    with self._lock:
+
+      record = {"id":        self._next_id,
+                "time":      round(time()),
+                "operation": operation,
+                "windows":   windows,
+                "files":     files}
+
+      self._next_id += 1
+
+      self._operations[record["id"]] = record
+
+      self._append(record)
+
+      return record["id"]
+
+  def last(self) -> dict:
+    """the latest operation not undone, or None"""
+
+    with self._lock:
+      return next(reversed(self._operations.values()), None)
+
+  def mark_undone(self, operation_id: int) -> None:
+
+    with self._lock:
+      if self._operations.pop(operation_id, None) is not None:
+        self._append({"undone": operation_id})
+
+  def close(self) -> None:
+
+    with self._lock:
+      if self._file is not None:
+        self._file.flush()
+        fsync(self._file.fileno())
+        self._file.close()
+        self._file = None
+
+  def _append(self, record: dict) -> None:
+    """writes a line, called holding _lock"""
+
+    if self._file is None:
+      makedirs(dirname(self._path), exist_ok=True)
+      self._file = open(self._path, 'a', encoding="utf8")
+      if self._torn:
+        self._file.write("\n")
+        self._torn = False
+
+    self._file.write(dumps(record, ensure_ascii=False, separators=(',', ':'))
+                     + "\n")
+
+    self._file.flush() # survives tab_wrangler crashing, if not the system
+
+    if monotonic() - self._synced_at >= fsync_interval:
+      fsync(self._file.fileno())
+      self._synced_at = monotonic()
+
+    if self._file.tell() > max_size:
+      self._compact()
+
+  def _compact(self) -> None:
+    """rewrites the journal with only the latest operations not undone"""
+
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+    lines = [] # newest first
+
+    size = 0
+
+    for operation_id, record in reversed(list(self._operations.items())):
+
+      line = dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+      size += len(line.encode())
+
+      if lines and size > compacted_size:
+        break
+
+      lines.append((operation_id, line))
+
+    kept = {operation_id for operation_id, line in lines}
+
+    for operation_id in list(self._operations):
+      if operation_id not in kept:
+        del self._operations[operation_id]
+
+    with open(self._path + ".new", 'w', encoding="utf8") as journal_file:
+      journal_file.writelines(line for operation_id, line in reversed(lines))
+      journal_file.flush()
+      fsync(journal_file.fileno())
+
+    replace(self._path + ".new", self._path)
+
+    self._torn = False
+
+    self._synced_at = monotonic()
+
+_journal = None
+
+def get_journal() -> Journal:
+
+  global _journal
+
+  if _journal is None:
+    _journal = Journal()
+
+  return _journal
+
+def close_journal() -> None:
+  """fsyncs and closes the journal"""
+
+  global _journal
+
+  if _journal is not None:
+    _journal.close()
+    _journal = None
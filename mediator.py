@@ -0,0 +1,125 @@
+#!/bin/env python
+
+from http.client import HTTPConnection
+from io import BytesIO
+from socket import SHUT_RDWR
+from threading import Lock
+from typing import Dict
+
+from brotab.api import HTTP_TIMEOUT, SingleMediatorAPI
+from brotab.inout import (MultiPartForm,
+                          get_mediator_ports,
+                          is_port_accepting_connections)
+from urllib.error import HTTPError, URLError
+
+from tab_wrangler.instrumentation import span
+
+
+class MediatorConnection(SingleMediatorAPI):
+  """brotab's client for one bt-mediator, reusing a single HTTP connection
+
+  brotab itself opens a new connection via urlopen for every request.
+  The connection is kept alive whenever the mediator allows it,
+  and is otherwise transparently reopened for the next request.
+  """
+
+  def __init__(self, prefix: str, host: str = "localhost", port: int = 4625):
+
+    self._lock = Lock()
+
+    self._closed = False
+
+    self._connection = HTTPConnection(host    = host,
+                                      port    = port,
+                                      timeout = HTTP_TIMEOUT)
+
+    super().__init__(prefix, host=host, port=port)
+
+  @property
+  def prefix(self) -> str:
+    return self._prefix
+
+  @property
+  def browser(self) -> str:
+    return self._browser
+
+  def close(self) -> None:
+
+    self._closed = True
+
+    socket = self._connection.sock
+
+    if socket is not None: # cut short any request in flight, holding the lock
+      try:
+        socket.shutdown(SHUT_RDWR)
+      except OSError:
+        pass
+
+    with self._lock:
+      self._connection.close()
+
+  def list_tabs(self, args):
+    """like brotab's, but without its limit of MAX_NUMBER_OF_TABS"""
+
+    if args:
+      return super().list_tabs(args)
+
+    return self.prefix_tabs(self._get("/list_tabs").splitlines())
+
+  def _get(self, path, data=None):
+
+    return self._request(method = "GET",
+                         path   = path,
+                         body   = None if data is None else data.encode("utf8"))
+
+  def _post(self, path, files=None):
+
+    form = MultiPartForm()
+
+    for filename, content in files.items():
+      form.add_file(filename, filename, BytesIO(content.encode("utf8")))
+
+    return self._request(method  = "POST",
+                         path    = path,
+                         body    = bytes(form),
+                         headers = {"Content-Type": form.get_content_type()})
+
+  def _request(self,
+               method:  str,
+               path:    str,
+               body:    bytes = None,
+               headers: Dict[str, str] = None
+               ) -> str:
+
+    url = f"http://{self._host}:{self._port}{path}"
+
+    with self._lock, span(f"rpc {self._prefix}",
+                          method   = method,
+                          endpoint = path.split('/')[1]):
+
+      while True:
+
+        reused = self._connection.sock is not None
+
+        try:
+          self._connection.request(method, path, body, headers or {})
+          response = self._connection.getresponse()
+          content = response.read().decode("utf8")
+
+        except (BrokenPipeError, ConnectionResetError) as error:
+          self._connection.close()
+          if reused and not self._closed: # dropped while idle: reconnect
+            continue
+          raise URLError(error)
+
+        except OSError as error: # refused, timed out...
+          self._connection.close()
+          raise URLError(error)
+
+        break
+
+    if response.status >= 400:
+      raise HTTPError(url, response.status, response.reason,
+                      response.headers, None)
+
+    return content
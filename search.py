@@ -0,0 +1,177 @@
+#!/bin/env python
+
+from re import compile, escape
+from typing import Dict, List, Set, Tuple
+
+from tab_wrangler.browser import Tab
+
+
+url_penalty = 32 # how much worse a match in a URL ranks than one in a title
+
+class SearchIndex:
+  """case-folded tab titles and URLs of a snapshot, for searching as you type
+
+  Each window's titles (and URLs) are joined into one string,
+  so checking a window costs a single substring search.
+  A query extending the previous one only rechecks the previous matches.
+  For filtering, each tab's title and URL are also kept as one line,
+  joined into one string per window, so that windows can be ranked
+  without looking at each tab, which is left until a window is shown.
+  """
+
+  def __init__(self):
+
+    self._raw:    Dict[str, Tuple[List[str], List[str]]] = {}
+    self._titles: Dict[str, str] = {}
+    self._joined: Dict[str, str] = {} # "title\turl" of each tab, as lines
+
+    self._query: str = None
+    self._matches: Set[str] = set()
+
+    self._filter_query: str = None
+    self._filter_search = None
+    self._filter_matches: List[str] = []
+    self._tab_matches: Dict[str, List[int]] = {} # of windows shown so far
+
+  def update(self, windows: Dict[str, List[Tab]]) -> None:
+    """syncs the index with a new snapshot,
+       normalizing only windows which were added or changed"""
+
+    for window_id in self._raw.keys() - windows.keys():
+      del self._raw[window_id]
+      del self._titles[window_id]
+      del self._joined[window_id]
+
+    for window_id, tabs in windows.items():
+
+      raw = ([tab["title"] for tab in tabs],
+             [tab["url"]   for tab in tabs])
+
+      if self._raw.get(window_id) == raw:
+        continue
+
+      self._raw[window_id] = raw
+      self._titles[window_id] = "\n".join(raw[0]).casefold()
+      self._joined[window_id] = "\n".join(
+        f"{title}\t{url}" for title, url in zip(*raw)).casefold()
+
+    self._query = None # matches may have changed
+
+    self._filter_query = None
+
+  def search(self, query: str) -> Set[str]:
+    """ids of windows with a tab title containing query, ignoring case"""
+
+    query = query.casefold()
+
+    if self._query is not None and query.startswith(self._query):
+      candidates = self._matches
+    else:
+      candidates = self._titles.keys()
+
+    self._matches = {window_id for window_id in candidates
+                     if query in self._titles[window_id]}
+
+    self._query = query
+
+    return self._matches
+
+  def filter(self, query: str) -> List[str]:
+    """ids of windows with a tab whose title or URL contains the characters
+       of query in order, ignoring case and spaces, best matches first
+
+    A window ranks by how close together the characters are first found
+    in its tabs, searched as a single string rather than tab by tab,
+    and better in a title than in a URL.
+    A query extending the previous one only rechecks the previous matches.
+    """
+
+    query = ''.join(query.split()).casefold()
+
+    if self._filter_query is not None and query.startswith(self._filter_query):
+      candidates = self._filter_matches
+    else:
+      candidates = self._joined.keys()
+
+    # each gap excluding the character after it, to match without backtracking
+    search = compile(escape(query[:1])
+                     + ''.join(f"[^\n{escape(character)}]*{escape(character)}"
+                               for character in query[1:])).search
+
+    scores = {}
+
+    for window_id in candidates:
+
+      joined = self._joined[window_id]
+
+      if query in self._titles[window_id]: # all together, which no scattered
+        scores[window_id] = len(query)     # match can beat
+        continue
+
+      start = joined.find(query)
+
+      if start != -1:
+        end = start + len(query)
+
+      else:
+
+        match = search(joined)
+
+        if match is None:
+          continue
+
+        start, end = match.span()
+
+      # in a URL if past the tab separating it from its title
+      in_url = start > joined.find("\t", joined.rfind("\n", 0, start) + 1)
+
+      scores[window_id] = end - start + in_url * url_penalty
+
+    self._filter_query = query
+
+    self._filter_search = search
+
+    self._filter_matches = sorted(scores, key=scores.get) # stable: ties keep
+                                                          # the window order
+    self._tab_matches = {}
+
+    return self._filter_matches
+
+  def filter_tabs(self, window_id: str) -> List[int]:
+    """positions of the window's tabs matching the last filter, best first
+
+    A tab matches better the closer together the characters are found,
+    and better in its title than in its URL.
+    """
+
+    if window_id in self._tab_matches:
+      return self._tab_matches[window_id]
+
+    scored = []
+
+    query = self._filter_query
+
+    for index, line in enumerate(self._joined[window_id].split("\n")):
+
+      start = line.find(query)
+
+      if start != -1: # all together, which no scattered match can beat
+        end = start + len(query)
+
+      else:
+
+        match = self._filter_search(line)
+
+        if match is None:
+          continue
+
+        start, end = match.span()
+
+      scored.append((end - start + (start > line.find("\t")) * url_penalty,
+                     index))
+
+    scored.sort()
+
+    self._tab_matches[window_id] = [index for score, index in scored]
+
+    return self._tab_matches[window_id]
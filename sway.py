@@ -0,0 +1,222 @@
+#!/bin/env python
+
+from json import dumps, loads
+from os import environ
+from socket import AF_UNIX, SOCK_STREAM, socket
+from struct import Struct
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+
+# https://i3wm.org/docs/ipc.html - also spoken by Sway
+
+RUN_COMMAND = 0
+SUBSCRIBE   = 2
+GET_TREE    = 4
+
+WINDOW_EVENT = 0x80000003
+
+_header = Struct("=6sII") # magic string, payload length, message type
+
+class IpcError(Exception):
+  pass
+
+def _connect(path: str) -> socket:
+
+  connection = socket(AF_UNIX, SOCK_STREAM)
+
+  connection.connect(path)
+
+  return connection
+
+def _send(connection: socket, message_type: int, payload: str = '') -> None:
+
+  payload = payload.encode()
+
+  connection.sendall(_header.pack(b"i3-ipc", len(payload), message_type)
+                     + payload)
+
+def _receive_exactly(connection: socket, length: int) -> bytes:
+
+  data = b''
+
+  while len(data) < length:
+
+    chunk = connection.recv(length - len(data))
+
+    if not chunk:
+      raise IpcError("connection closed by window manager")
+
+    data += chunk
+
+  return data
+
+def _receive(connection: socket) -> Tuple[int, object]:
+
+  magic, length, message_type = _header.unpack(
+    _receive_exactly(connection, _header.size))
+
+  if magic != b"i3-ipc":
+    raise IpcError(f"unexpected reply: {magic}")
+
+  return message_type, loads(_receive_exactly(connection, length))
+
+class Sway:
+  """client for the i3/Sway IPC socket
+
+  Keeps the titles of all windows cached, kept current through a second
+  connection subscribed to window events, so finding a window by title
+  costs neither a process spawn nor a tree serialization.
+  The events' thread changes the cache under _windows_lock,
+  so it is only read under it too, or copied.
+  """
+
+  def __init__(self, path: str):
+
+    self._lock = Lock()
+
+    self._windows_lock = Lock()
+
+    self._connection = _connect(path)
+
+    self._windows: Dict[int, Tuple[str, str]] = None # con_id: (title, app)
+
+    self._following = True # whether window events keep _windows current
+
+    self._events = _connect(path)
+
+    _send(self._events, SUBSCRIBE, dumps(["window"]))
+
+    _, reply = _receive(self._events)
+
+    if not reply.get("success"):
+      raise IpcError("could not subscribe to window events")
+
+    Thread(target = self._follow_events,
+           name   = "sway events",
+           daemon = True).start()
+
+  def close(self) -> None:
+
+    with self._lock:
+      self._connection.close()
+
+    self._events.close()
+
+  def command(self, command: str) -> List[dict]:
+
+    with self._lock:
+      _send(self._connection, RUN_COMMAND, command)
+      return _receive(self._connection)[1]
+
+  def get_tree(self) -> dict:
+
+    with self._lock:
+      _send(self._connection, GET_TREE)
+      return _receive(self._connection)[1]
+
+  @property
+  def windows(self) -> Dict[int, Tuple[str, str]]:
+    """con_id: (title, app_id or X11 class) of every window, as a copy"""
+
+    with self._windows_lock:
+      if self._windows is not None and self._following:
+        return dict(self._windows)
+
+    windows = {}
+
+    self._collect(self.get_tree(), windows)
+
+    with self._windows_lock:
+      self._windows = windows
+      return dict(windows)
+
+  def find_window(self, title: str, app: str = None) -> Optional[int]:
+    """con_id of a window titled title, or title followed by the app name
+
+    Where several windows match, exact titles come first,
+    then windows whose app_id or class contains app.
+    """
+
+    candidates = [(window_title != title,
+                   app is None or app.lower() not in window_app.lower(),
+                   con_id)
+                  for con_id, (window_title, window_app)
+                  in self.windows.items()
+                  if window_title.startswith(title)]
+
+    if not candidates:
+      return None
+
+    return min(candidates)[2]
+
+  def focus(self, con_id: int) -> bool:
+
+    reply = self.command(f"[con_id={con_id}] focus")
+
+    return bool(reply) and all(result.get("success") for result in reply)
+
+  def _collect(self, node: dict, windows: Dict[int, Tuple[str, str]]) -> None:
+
+    for child in node.get("nodes", []) + node.get("floating_nodes", []):
+
+      if child.get("type") in ("con", "floating_con") and child.get("name"):
+        windows[child["id"]] = (child["name"], self._app(child))
+
+      self._collect(child, windows)
+
+  def _app(self, container: dict) -> str:
+    return (container.get("app_id")
+            or (container.get("window_properties") or {}).get("class")
+            or '')
+
+  def _follow_events(self) -> None:
+    """runs in its own thread, applying window events to the cache"""
+
+    try:
+
+      while True:
+
+        message_type, event = _receive(self._events)
+
+        if message_type != WINDOW_EVENT:
+          continue
+
+        container = event.get("container", {})
+
+        with self._windows_lock:
+
+          windows = self._windows
+
+          if windows is None:
+            continue
+
+          if event.get("change") == "close":
+            windows.pop(container.get("id"), None)
+          elif container.get("name"):
+            windows[container["id"]] = (container["name"],
+                                        self._app(container))
+
+    except (IpcError, OSError):
+      self._following = False # fall back to fetching the tree every time
+
+_sway = None
+
+def get_sway() -> Optional[Sway]:
+  """the shared client, or None if not running under Sway (or i3)"""
+
+  global _sway
+
+  if _sway is None:
+
+    path = environ.get("SWAYSOCK") or environ.get("I3SOCK")
+
+    if path is None:
+      return None
+
+    try:
+      _sway = Sway(path)
+    except (IpcError, OSError):
+      return None
+
+  return _sway